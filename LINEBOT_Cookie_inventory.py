@@ -10,20 +10,27 @@ import os
 import sys
 # 設置標準輸出編碼為 UTF-8，避免 Windows 編碼問題
 if sys.platform == 'win32':
-    import io
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from flask import Flask, request, abort
-from linebot.v3.messaging import (Configuration, ApiClient, MessagingApi, ReplyMessageRequest, TextMessage)
+import urllib3
 import json
 import hmac
 import hashlib
 import base64
-import traceback
-import re
 import logging
+import logging.handlers
+import queue
+import ssl
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from functools import lru_cache, partial
+from operator import itemgetter
 
 # 導入 ERP 資料庫輔助模組
 from cookies_inventory.erp_db_helper import ERPDBHelper
@@ -43,69 +50,124 @@ CHANNEL_SECRET = line_config.get("CHANNEL_SECRET")
 if not CHANNEL_ACCESS_TOKEN or not CHANNEL_SECRET:
     raise ValueError("LINE Bot 憑證檔案中缺少 CHANNEL_ACCESS_TOKEN 或 CHANNEL_SECRET")
 
-configuration = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
+CHANNEL_SECRET_BYTES = CHANNEL_SECRET.encode()
+
+# 預先以金鑰初始化 HMAC-SHA256 狀態，每次驗證只需 copy() 後更新內容，省去金鑰填充的雜湊計算
+# hashlib 的 SHA-256 由 OpenSSL 實作，OpenSSL 1.1.1 以上會自動偵測並使用 CPU 的 SHA 指令集
+_SIGNATURE_HMAC = hmac.new(CHANNEL_SECRET_BYTES, digestmod=hashlib.sha256)
+
+# LINE Messaging API 回覆端點：直接以 JSON POST，省去 SDK 的模型建構與驗證
+LINE_REPLY_URL = 'https://api.line.me/v2/bot/message/reply'
+LINE_REPLY_HEADERS = {
+    'Authorization': f'Bearer {CHANNEL_ACCESS_TOKEN}',
+    'Content-Type': 'application/json'
+}
+
+# 常駐的 HTTP 連線池：保持與 LINE API 的 TLS 連線，避免每次回覆重新建立連線
+line_http = urllib3.PoolManager(maxsize=8, timeout=urllib3.Timeout(total=10.0), retries=False)
 
 # 固定庫別代號
 DEFAULT_WAREHOUSE_CODE = 'SP50'
 
+# 庫存期別（INVLC.LC002，YYYYMM）；INVLA 異動資料自該期別的 1 日起算
+# 期別與起算日皆以參數傳入 SQL，讓同一個執行計畫可跨月份重複使用
+INVENTORY_PERIOD = '202512'
+
 # 設定日誌
+# 檔案日誌經 MemoryHandler 緩衝，累積 64 筆才寫入一次；ERROR 以上等級立即寫入
+_log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+_log_file_handler = logging.FileHandler('linebot_inventory.log', encoding='utf-8')
+_log_file_handler.setFormatter(_log_formatter)
 logging.basicConfig(level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler('linebot_inventory.log', encoding='utf-8'),logging.StreamHandler()])
+    handlers=[logging.handlers.MemoryHandler(capacity=64, flushLevel=logging.ERROR, target=_log_file_handler),
+              logging.StreamHandler()])
 logger = logging.getLogger(__name__)
 
 # ==================== SQL 查詢定義 ====================
+# INVLA 的 JOIN 條件（LA001, LA009, LA004）建議在 ERP 端建立涵蓋索引，讓 LEFT JOIN 變成索引搜尋：
+#   CREATE INDEX IX_INVLA_LA001_LA009_LA004 ON INVLA (LA001, LA009, LA004) INCLUDE (LA011, LA005)
+# LA004 為 YYYYMMDD 字串，與同型別的參數比較時可直接使用上述索引
 # 查詢指定餅乾代號在指定庫別的庫存
 # 基於 config.ini 中的查詢邏輯，但加入 WHERE 條件過濾特定代號和庫別
 # 從 INVMB 產品主檔取得品名和庫存單位
 COOKIE_INVENTORY_BY_CODE_SQL = """
     SELECT 
-        LC.LC001 as cookie_code,
-        MB.MB002 as product_name,
-        LC.LC003 as warehouse_code,
+        RTRIM(LC.LC001) as cookie_code,
+        COALESCE(RTRIM(MB.MB002), '') as product_name,
+        RTRIM(LC.LC003) as warehouse_code,
         LC.LC004 + COALESCE(SUM(LA.LA011 * LA.LA005), 0) as qty,
-        MB.MB004 as unit
+        COALESCE(RTRIM(MB.MB004), '') as unit
     FROM [AS_online].[dbo].[INVLC] LC
     LEFT JOIN [AS_online].[dbo].[INVLA] LA 
         ON LA.LA001 = LC.LC001 
         AND LA.LA009 = LC.LC003
-        AND LA.LA004 >= '20251201'
+        AND LA.LA004 >= ?
     LEFT JOIN [AS_online].[dbo].[INVMB] MB
         ON MB.MB001 = LC.LC001
     WHERE LC.LC001 = ?
         AND LC.LC001 IS NOT NULL 
-        AND LC.LC002 = '202512' 
+        AND LC.LC002 = ? 
         AND LC.LC003 = ?
     GROUP BY LC.LC001, LC.LC003, LC.LC004, MB.MB002, MB.MB004
 """
 
 # 關鍵字查詢 SQL：查詢 SP50 庫別中品名包含關鍵字且有庫存的品項
 # 支援單個字母關鍵字查詢（A、B、E、F、G、H、J、K、Y 等）
-# 使用 UPPER 函數確保大小寫不敏感
-COOKIE_INVENTORY_BY_KEYWORD_SQL = """
-    SELECT 
-        LC.LC001 as cookie_code,
-        MB.MB002 as product_name,
-        LC.LC003 as warehouse_code,
+# 以不分大小寫的定序（_CI_）比對，不需對每一列品名呼叫 UPPER 函數
+# 若 ERP 端建立 INVMB(MB002) 全文檢索索引，可再改用 CONTAINS 述詞以索引搜尋取代掃描
+# 回覆訊息上限約 5000 字元（每筆約 30 字元），因此只取前 KEYWORD_RESULT_LIMIT 筆
+KEYWORD_RESULT_LIMIT = 200
+COOKIE_INVENTORY_BY_KEYWORD_SQL = f"""
+    SELECT TOP {KEYWORD_RESULT_LIMIT}
+        RTRIM(LC.LC001) as cookie_code,
+        COALESCE(RTRIM(MB.MB002), '') as product_name,
+        RTRIM(LC.LC003) as warehouse_code,
         LC.LC004 + COALESCE(SUM(LA.LA011 * LA.LA005), 0) as qty,
-        MB.MB004 as unit
+        COALESCE(RTRIM(MB.MB004), '') as unit
     FROM [AS_online].[dbo].[INVLC] LC
     LEFT JOIN [AS_online].[dbo].[INVLA] LA 
         ON LA.LA001 = LC.LC001 
         AND LA.LA009 = LC.LC003
-        AND LA.LA004 >= '20251201'
+        AND LA.LA004 >= ?
     LEFT JOIN [AS_online].[dbo].[INVMB] MB
         ON MB.MB001 = LC.LC001
     WHERE LC.LC001 IS NOT NULL 
-        AND LC.LC002 = '202512' 
+        AND LC.LC002 = ? 
         AND LC.LC003 = ?
-        AND UPPER(MB.MB002) LIKE UPPER(?)
+        AND MB.MB002 LIKE ? COLLATE Chinese_Taiwan_Stroke_CI_AS
     GROUP BY LC.LC001, LC.LC003, LC.LC004, MB.MB002, MB.MB004
     HAVING (LC.LC004 + COALESCE(SUM(LA.LA011 * LA.LA005), 0)) > 0
     ORDER BY MB.MB002, LC.LC001
 """
 
 # ==================== 訊息解析函數 ====================
+# 品號格式：前5碼數字 + 第6碼數字或英文 + 第7碼英文（可選）
+# 以 bytes.translate（C 層級逐字元轉換）將字元分類為 9（數字）、A（英文字母）、?（其他），
+# 再比對分類後的字串，整個判斷不需逐字元執行 Python bytecode，也不經過正則表達式引擎
+_CHAR_CLASS = bytes(
+    0x39 if 0x30 <= i <= 0x39 else 0x41 if 0x41 <= i <= 0x5A or 0x61 <= i <= 0x7A else 0x3F
+    for i in range(256)
+)
+
+
+def is_cookie_code(message: str) -> bool:
+    """
+    判斷字串是否符合品號格式（等同 ^[0-9]{5}[A-Za-z0-9][A-Za-z]?$）
+    
+    Args:
+        message: 已去除前後空白的字串
+        
+    Returns:
+        是否為品號
+    """
+    n = len(message)
+    if (n != 6 and n != 7) or not message.isascii():
+        return False
+    classes = message.encode('ascii').translate(_CHAR_CLASS)
+    return classes[:5] == b'99999' and classes[5] != 0x3F and classes[6:] in (b'', b'A')
+
+
 def parse_user_input(message: str) -> tuple[str, str]:
     """
     解析使用者輸入，判斷是品號還是關鍵字
@@ -131,30 +193,117 @@ def parse_user_input(message: str) -> tuple[str, str]:
     
     message = message.strip()
     
-    # 正則表達式：匹配品號格式
-    # 格式：^[0-9]{5}[A-Za-z0-9][A-Za-z]?$
-    pattern = r'^[0-9]{5}[A-Za-z0-9][A-Za-z]?$'
-    
     # 檢查整個訊息是否符合品號格式
-    if re.match(pattern, message):
+    if is_cookie_code(message):
         cookie_code = message.upper()
-        logger.info(f"從訊息 '{message}' 中識別為品號: {cookie_code}")
+        logger.info("從訊息 '%s' 中識別為品號: %s", message, cookie_code)
         return ('code', cookie_code)
     
     # 不符合品號格式，視為關鍵字
     keyword = message.strip()
-    logger.info(f"從訊息 '{message}' 中識別為關鍵字: {keyword}")
+    logger.info("從訊息 '%s' 中識別為關鍵字: %s", message, keyword)
     return ('keyword', keyword)
 
 
 # ==================== 庫存查詢函數 ====================
-def query_cookie_inventory(cookie_code: str, warehouse_code: str = DEFAULT_WAREHOUSE_CODE) -> Optional[Dict[str, Any]]:
+# 查詢結果快取：以 60 秒為一個時間區段（bucket），區段改變後舊結果會自然被 LRU 淘汰
+CACHE_TTL_SECONDS = 60
+CACHE_MAX_SIZE = 1024
+
+
+def _cache_bucket() -> int:
+    """取得目前的快取時間區段"""
+    return int(time.time() // CACHE_TTL_SECONDS)
+
+
+# 資料庫連線池：保留已登入的連線供後續請求重複使用，避免每次查詢重新建立連線
+# 池中保存 (連線, 歸還時間)；閒置超過 DB_POOL_IDLE_CHECK_SECONDS 秒的連線才在取出時以 SELECT 1 檢查，
+# 連續查詢時不額外多一次資料庫往返
+DB_POOL_SIZE = 8
+DB_POOL_IDLE_CHECK_SECONDS = 30
+_db_pool: queue.LifoQueue = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+
+@contextmanager
+def get_db():
+    """
+    從連線池取得 ERP 資料庫連線，使用完畢後歸還
+    
+    - 連線池沒有可用連線時建立新連線
+    - 閒置過久的連線取出時檢查狀態，失效的連線會關閉並重新建立
+    - 使用過程發生錯誤時關閉該連線，不歸還連線池
+    """
+    try:
+        erp_db, returned_at = _db_pool.get_nowait()
+        if time.monotonic() - returned_at > DB_POOL_IDLE_CHECK_SECONDS and not erp_db.is_alive():
+            logger.warning("資料庫連線已失效，重新建立連線")
+            erp_db.close()
+            erp_db = ERPDBHelper()
+    except queue.Empty:
+        erp_db = ERPDBHelper()
+    
+    try:
+        yield erp_db
+    except Exception:
+        erp_db.close()
+        raise
+    
+    try:
+        _db_pool.put_nowait((erp_db, time.monotonic()))
+    except queue.Full:
+        erp_db.close()
+
+
+# 查詢結果欄位（SQL 端已 RTRIM 並以 COALESCE 補上空字串，Python 端不需再 strip）
+_INVENTORY_FIELDS = ('cookie_code', 'product_name', 'warehouse_code', 'qty', 'unit')
+_get_inventory_fields = itemgetter(*_INVENTORY_FIELDS)
+
+
+def _row_to_inventory(row: Dict[str, Any]) -> Dict[str, Any]:
+    """將查詢結果資料列轉換為庫存資料字典"""
+    inventory_data = dict(zip(_INVENTORY_FIELDS, _get_inventory_fields(row)))
+    qty = inventory_data['qty']
+    inventory_data['qty'] = float(qty) if qty is not None else 0.0
+    return inventory_data
+
+
+@lru_cache(maxsize=CACHE_MAX_SIZE)
+def _cached_query_code(cookie_code: str, warehouse_code: str, period: str, bucket: int) -> Optional[Dict[str, Any]]:
+    """品號查詢（快取層）；發生錯誤時直接拋出例外，不會被快取"""
+    with get_db() as erp_db:
+        # 使用參數化查詢防止 SQL 注入
+        results = erp_db.execute_query(
+            COOKIE_INVENTORY_BY_CODE_SQL,
+            params=(f'{period}01', cookie_code, period, warehouse_code)
+        )
+    return _row_to_inventory(results[0]) if results else None
+
+
+@lru_cache(maxsize=CACHE_MAX_SIZE)
+def _cached_query_keyword(keyword: str, warehouse_code: str, period: str, bucket: int) -> Tuple[Dict[str, Any], ...]:
+    """關鍵字查詢（快取層）；發生錯誤時直接拋出例外，不會被快取"""
+    # 關鍵字前後加上 % 用於 LIKE 查詢
+    keyword_pattern = f'%{keyword}%'
+    with get_db() as erp_db:
+        # 使用參數化查詢防止 SQL 注入
+        results = erp_db.execute_query(
+            COOKIE_INVENTORY_BY_KEYWORD_SQL,
+            params=(f'{period}01', period, warehouse_code, keyword_pattern)
+        )
+    return tuple(_row_to_inventory(row) for row in results)
+
+
+def query_cookie_inventory(cookie_code: str, warehouse_code: str = DEFAULT_WAREHOUSE_CODE,
+                           period: str = INVENTORY_PERIOD) -> Optional[Dict[str, Any]]:
     """
     查詢指定餅乾代號在指定庫別的庫存
     
+    同一品號在 CACHE_TTL_SECONDS 秒內重複查詢時直接使用快取結果
+    
     Args:
         cookie_code: 餅乾代號
         warehouse_code: 庫別代號（預設為 SP50）
+        period: 庫存期別（YYYYMM，預設為 INVENTORY_PERIOD）
         
     Returns:
         庫存資料字典，格式: {
@@ -167,50 +316,32 @@ def query_cookie_inventory(cookie_code: str, warehouse_code: str = DEFAULT_WAREH
         如果查無資料或發生錯誤則返回 None
     """
     try:
-        logger.info(f"查詢庫存: 餅乾代號={cookie_code}, 庫別={warehouse_code}")
+        logger.info("查詢庫存: 餅乾代號=%s, 庫別=%s", cookie_code, warehouse_code)
         
-        with ERPDBHelper() as erp_db:
-            # 使用參數化查詢防止 SQL 注入
-            results = erp_db.execute_query(
-                COOKIE_INVENTORY_BY_CODE_SQL,
-                params=(cookie_code, warehouse_code)
-            )
-            
-            if results and len(results) > 0:
-                row = results[0]
-                # 取得各欄位資料
-                cookie_code = str(row.get('cookie_code', '')).strip()
-                product_name = str(row.get('product_name', '')).strip() if row.get('product_name') else ''
-                warehouse_code = str(row.get('warehouse_code', '')).strip()
-                qty = float(row.get('qty', 0)) if row.get('qty') is not None else 0.0
-                unit = str(row.get('unit', '')).strip() if row.get('unit') else ''
-                
-                inventory_data = {
-                    'cookie_code': cookie_code,
-                    'product_name': product_name,
-                    'warehouse_code': warehouse_code,
-                    'qty': qty,
-                    'unit': unit
-                }
-                logger.info(f"查詢成功: {inventory_data}")
-                return inventory_data
-            else:
-                logger.warning(f"查無資料: 餅乾代號={cookie_code}, 庫別={warehouse_code}")
-                return None
+        inventory_data = _cached_query_code(cookie_code, warehouse_code, period, _cache_bucket())
+        if inventory_data is not None:
+            logger.info("查詢成功: %s", inventory_data)
+            return dict(inventory_data)
+        
+        logger.warning("查無資料: 餅乾代號=%s, 庫別=%s", cookie_code, warehouse_code)
+        return None
                 
     except Exception as e:
-        logger.error(f"查詢庫存時發生錯誤: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("查詢庫存時發生錯誤: %s", e)
         return None
 
 
-def query_cookie_inventory_by_keyword(keyword: str, warehouse_code: str = DEFAULT_WAREHOUSE_CODE) -> List[Dict[str, Any]]:
+def query_cookie_inventory_by_keyword(keyword: str, warehouse_code: str = DEFAULT_WAREHOUSE_CODE,
+                                      period: str = INVENTORY_PERIOD) -> List[Dict[str, Any]]:
     """
     使用關鍵字查詢 SP50 庫別中品名包含關鍵字且有庫存的品項
     
+    同一關鍵字在 CACHE_TTL_SECONDS 秒內重複查詢時直接使用快取結果
+    
     Args:
         keyword: 關鍵字（會用於 LIKE 查詢，自動加上 % 前後綴）
         warehouse_code: 庫別代號（預設為 SP50）
+        period: 庫存期別（YYYYMM，預設為 INVENTORY_PERIOD）
         
     Returns:
         庫存資料列表，格式: [
@@ -226,49 +357,27 @@ def query_cookie_inventory_by_keyword(keyword: str, warehouse_code: str = DEFAUL
         如果查無資料則返回空列表
     """
     try:
-        logger.info(f"關鍵字查詢庫存: 關鍵字={keyword}, 庫別={warehouse_code}")
+        logger.info("關鍵字查詢庫存: 關鍵字=%s, 庫別=%s", keyword, warehouse_code)
         
-        # 關鍵字前後加上 % 用於 LIKE 查詢
-        keyword_pattern = f'%{keyword}%'
+        inventory_list = [dict(item) for item in _cached_query_keyword(keyword, warehouse_code, period, _cache_bucket())]
+        if inventory_list:
+            logger.info("關鍵字查詢成功: 找到 %s 筆資料", len(inventory_list))
+        else:
+            logger.warning("關鍵字查詢無資料: 關鍵字=%s, 庫別=%s", keyword, warehouse_code)
         
-        with ERPDBHelper() as erp_db:
-            # 使用參數化查詢防止 SQL 注入
-            results = erp_db.execute_query(
-                COOKIE_INVENTORY_BY_KEYWORD_SQL,
-                params=(warehouse_code, keyword_pattern)
-            )
-            
-            inventory_list = []
-            if results and len(results) > 0:
-                for row in results:
-                    cookie_code = str(row.get('cookie_code', '')).strip()
-                    product_name = str(row.get('product_name', '')).strip() if row.get('product_name') else ''
-                    wh_code = str(row.get('warehouse_code', '')).strip()
-                    qty = float(row.get('qty', 0)) if row.get('qty') is not None else 0.0
-                    unit = str(row.get('unit', '')).strip() if row.get('unit') else ''
-                    
-                    inventory_data = {
-                        'cookie_code': cookie_code,
-                        'product_name': product_name,
-                        'warehouse_code': wh_code,
-                        'qty': qty,
-                        'unit': unit
-                    }
-                    inventory_list.append(inventory_data)
-                
-                logger.info(f"關鍵字查詢成功: 找到 {len(inventory_list)} 筆資料")
-            else:
-                logger.warning(f"關鍵字查詢無資料: 關鍵字={keyword}, 庫別={warehouse_code}")
-            
-            return inventory_list
+        return inventory_list
                 
     except Exception as e:
-        logger.error(f"關鍵字查詢庫存時發生錯誤: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("關鍵字查詢庫存時發生錯誤: %s", e)
         return []
 
 
 # ==================== 回覆格式化函數 ====================
+def format_qty(qty: float) -> str:
+    """格式化數量（加入千分位，整數不顯示小數；非整數一律顯示兩位小數，例如 0.999 顯示為 1.00）"""
+    return f"{qty:,.0f}" if qty == int(qty) else f"{qty:,.2f}"
+
+
 def format_inventory_reply(inventory_data: Dict[str, Any]) -> str:
     """
     格式化單筆庫存資料為 LINE Bot 回覆訊息
@@ -280,37 +389,30 @@ def format_inventory_reply(inventory_data: Dict[str, Any]) -> str:
         格式化的訊息字串
     """
     cookie_code = inventory_data.get('cookie_code', '')
-    product_name = inventory_data.get('product_name', '').strip()
+    product_name = inventory_data.get('product_name', '')
     warehouse_code = inventory_data.get('warehouse_code', '')
     qty = inventory_data.get('qty', 0)
-    unit = inventory_data.get('unit', '').strip()
+    unit = inventory_data.get('unit', '')
     update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     # 格式化數量（加入千分位）
-    qty_str = f"{qty:,.0f}" if qty == int(qty) else f"{qty:,.2f}"
+    qty_str = format_qty(qty)
     
     # 如果有單位則顯示，沒有則不顯示
     qty_display = f"{qty_str} {unit}" if unit else qty_str
     
-    # 建立回覆訊息
-    reply_lines = [
-        "📦 庫存查詢結果",
-        "",
-        f"品號：{cookie_code}"
-    ]
-    
     # 如果有品名則顯示
-    if product_name:
-        reply_lines.append(f"品名：{product_name}")
+    product_line = f"品名：{product_name}\n" if product_name else ""
     
-    reply_lines.extend([
-        f"庫別代號：{warehouse_code}",
-        f"目前庫存：{qty_display}",
+    # 建立回覆訊息
+    return (
+        f"📦 庫存查詢結果\n\n"
+        f"品號：{cookie_code}\n"
+        f"{product_line}"
+        f"庫別代號：{warehouse_code}\n"
+        f"目前庫存：{qty_display}\n"
         f"查詢時間：{update_time}"
-    ])
-    
-    reply = "\n".join(reply_lines)
-    return reply
+    )
 
 
 def format_keyword_reply(inventory_list: List[Dict[str, Any]], keyword: str) -> str:
@@ -327,41 +429,22 @@ def format_keyword_reply(inventory_list: List[Dict[str, Any]], keyword: str) ->
     if not inventory_list:
         return f"❌ 查無符合條件的庫存資料（關鍵字：「{keyword}」）"
     
-    # 建立回覆訊息，只顯示品名、品號、庫存數量、庫存單位
-    reply_lines = []
+    # 每筆顯示格式：品名 品號 庫存數量 庫存單位（無品名時以品號代替；數量以 format_qty 格式化）
+    reply = "\n".join(
+        f"{item['product_name'] or item['cookie_code']} {item['cookie_code']} {format_qty(item['qty'])}"
+        + (f" {item['unit']}" if item['unit'] else "")
+        for item in inventory_list
+    )
     
-    # 格式化每一筆資料
-    for item in inventory_list:
-        cookie_code = item.get('cookie_code', '')
-        product_name = item.get('product_name', '').strip()
-        qty = item.get('qty', 0)
-        unit = item.get('unit', '').strip()
-        
-        # 格式化數量
-        qty_str = f"{qty:,.0f}" if qty == int(qty) else f"{qty:,.2f}"
-        qty_display = f"{qty_str} {unit}" if unit else qty_str
-        
-        # 顯示格式：品名 品號 庫存數量 庫存單位
-        display_name = product_name if product_name else cookie_code
-        reply_lines.append(f"{display_name} {cookie_code} {qty_display}")
+    # 查詢結果達上限時提示使用者縮小範圍（放在第一行，避免被訊息長度截斷）
+    if len(inventory_list) >= KEYWORD_RESULT_LIMIT:
+        reply = f"（僅顯示前 {KEYWORD_RESULT_LIMIT} 筆，請縮小關鍵字範圍）\n\n{reply}"
     
-    reply = "\n".join(reply_lines)
     return reply
 
 
-def format_error_reply(error_type: str, cookie_code: str = None) -> str:
-    """
-    格式化錯誤回覆訊息
-    
-    Args:
-        error_type: 錯誤類型（'no_code', 'not_found', 'system_error'）
-        cookie_code: 餅乾代號（可選）
-        
-    Returns:
-        錯誤訊息字串
-    """
-    if error_type == 'no_code':
-        return """❌ 無法識別輸入
+# 固定內容的錯誤訊息
+_NO_CODE_MSG = """❌ 無法識別輸入
 
 請輸入：
 1️⃣ 品號（6-7碼格式）：
@@ -374,8 +457,33 @@ def format_error_reply(error_type: str, cookie_code: str = None) -> str:
 2️⃣ 關鍵字（品名搜尋）：
    輸入品名中的關鍵字，例如：牛奶、草莓
    系統會搜尋 SP50 庫別中包含該關鍵字的所有品項"""
+
+_SYSTEM_ERROR_MSG = """⚠️ 系統暫時無法查詢
+
+請稍後再試，或聯繫系統管理員。
+
+錯誤已記錄，我們會盡快處理。"""
+
+_UNKNOWN_ERROR_MSG = "❌ 發生未知錯誤，請稍後再試。"
+
+_FIXED_ERROR_MESSAGES = {
+    'no_code': _NO_CODE_MSG,
+    'system_error': _SYSTEM_ERROR_MSG,
+}
+
+
+def format_error_reply(error_type: str, cookie_code: str = None) -> str:
+    """
+    格式化錯誤回覆訊息
     
-    elif error_type == 'not_found':
+    Args:
+        error_type: 錯誤類型（'no_code', 'not_found', 'system_error'）
+        cookie_code: 餅乾代號（可選）
+        
+    Returns:
+        錯誤訊息字串
+    """
+    if error_type == 'not_found':
         code_msg = f"（代號：{cookie_code}）" if cookie_code else ""
         return f"""❌ 查無庫存資料{code_msg}
 
@@ -386,15 +494,94 @@ def format_error_reply(error_type: str, cookie_code: str = None) -> str:
 
 請確認代號是否正確，或聯繫管理員。"""
     
-    elif error_type == 'system_error':
-        return """⚠️ 系統暫時無法查詢
+    return _FIXED_ERROR_MESSAGES.get(error_type, _UNKNOWN_ERROR_MSG)
+
+
+# ==================== 單字母關鍵字預熱 ====================
+# 單一英文字母（A、B、E...）是最常見的關鍵字查詢，結果筆數多且重複查詢
+# 由背景計時器每 CACHE_TTL_SECONDS 秒直接查詢 ERP（不經過 LRU 快取）並格式化回覆，請求時直接取用；
+# 回覆只在查詢後 CACHE_TTL_SECONDS 秒內有效，庫存資料最多落後 CACHE_TTL_SECONDS 秒
+# 只預熱最近 HOT_KEYWORD_IDLE_SECONDS 秒內被查詢過的（字母, 庫別），沒有使用者查詢時不會對 ERP 發出查詢
+HOT_KEYWORDS = frozenset(string.ascii_uppercase)
+HOT_KEYWORD_IDLE_SECONDS = 10 * 60
+# key: (字母, 庫別)，value: (查詢時間, 格式化後的回覆)
+_hot_keyword_replies: Dict[Tuple[str, str], Tuple[float, str]] = {}
+# key: (字母, 庫別)，value: 最後一次被查詢的時間
+_hot_keyword_hits: Dict[Tuple[str, str], float] = {}
+_hot_keyword_refresher_started = False
+_hot_keyword_refresher_lock = threading.Lock()
+
+
+def _hot_keyword_key(keyword: str, warehouse_code: str) -> Optional[Tuple[str, str]]:
+    """取得預熱快取的鍵；非單一英文字母的關鍵字返回 None"""
+    if len(keyword) != 1:
+        return None
+    # upper() 可能把單一字元展開為多個字母（例如 'ﬆ' → 'ST'），因此轉換後仍需確認只有一個字母
+    letter = keyword.upper()
+    return (letter, warehouse_code) if len(letter) == 1 and letter in HOT_KEYWORDS else None
 
-請稍後再試，或聯繫系統管理員。
 
-錯誤已記錄，我們會盡快處理。"""
+def refresh_hot_keywords() -> None:
+    """預先查詢最近被查詢過的單字母關鍵字並快取格式化後的回覆，完成後排程下一次更新"""
+    try:
+        now = time.time()
+        for key, last_hit in list(_hot_keyword_hits.items()):
+            letter, warehouse_code = key
+            if now - last_hit > HOT_KEYWORD_IDLE_SECONDS:
+                # 一段時間沒有人查詢，停止預熱
+                _hot_keyword_hits.pop(key, None)
+                _hot_keyword_replies.pop(key, None)
+                continue
+            try:
+                # 直接呼叫未快取的查詢函數：LRU 快取中的結果可能已接近一個週期之久
+                queried_at = time.time()
+                inventory_list = _cached_query_keyword.__wrapped__(letter, warehouse_code, INVENTORY_PERIOD, 0)
+                _hot_keyword_replies[key] = (queried_at, format_keyword_reply(inventory_list, letter))
+            except Exception as e:
+                # 查詢失敗時移除舊快取，改由一般查詢流程處理
+                _hot_keyword_replies.pop(key, None)
+                logger.warning("預熱關鍵字 %s（庫別 %s）失敗: %s", letter, warehouse_code, e)
+    except Exception:
+        logger.exception("預熱關鍵字時發生錯誤")
+    finally:
+        # 無論本次更新是否出錯都排程下一次，避免預熱在程序存活期間就此停止
+        timer = threading.Timer(CACHE_TTL_SECONDS, refresh_hot_keywords)
+        timer.daemon = True
+        timer.start()
+
+
+def start_hot_keyword_refresher() -> None:
+    """啟動單字母關鍵字的背景預熱計時器（同一程序只啟動一次）"""
+    global _hot_keyword_refresher_started
+    with _hot_keyword_refresher_lock:
+        if _hot_keyword_refresher_started:
+            return
+        _hot_keyword_refresher_started = True
+    timer = threading.Timer(CACHE_TTL_SECONDS, refresh_hot_keywords)
+    timer.daemon = True
+    timer.start()
+
+
+def get_hot_keyword_reply(keyword: str, warehouse_code: str = DEFAULT_WAREHOUSE_CODE) -> Optional[str]:
+    """
+    取得單字母關鍵字的預熱回覆，並記錄此次查詢供背景計時器預熱
     
-    else:
-        return "❌ 發生未知錯誤，請稍後再試。"
+    Args:
+        keyword: 關鍵字
+        warehouse_code: 庫別代號（預設為 SP50）
+        
+    Returns:
+        預熱的回覆訊息；非單字母關鍵字、尚未預熱或快取已過期則返回 None
+    """
+    key = _hot_keyword_key(keyword, warehouse_code)
+    if key is None:
+        return None
+    _hot_keyword_hits[key] = time.time()
+    cached = _hot_keyword_replies.get(key)
+    # 查詢時間超過 CACHE_TTL_SECONDS 秒（例如背景計時器延遲或異常）則視為過期，改由一般查詢流程處理
+    if cached is None or time.time() - cached[0] > CACHE_TTL_SECONDS:
+        return None
+    return cached[1]
 
 
 # ==================== LINE Bot 處理函數 ====================
@@ -415,6 +602,30 @@ def truncate_message(text: str, max_length: int = 5000) -> str:
     return truncated + "\n\n...（訊息過長，已截斷）"
 
 
+def _handle_code_query(cookie_code: str, warehouse_code: str) -> str:
+    """品號查詢並格式化單筆回覆"""
+    inventory_data = query_cookie_inventory(cookie_code, warehouse_code)
+    if inventory_data is None:
+        return format_error_reply('not_found', cookie_code)
+    return format_inventory_reply(inventory_data)
+
+
+def _handle_keyword_query(keyword: str, warehouse_code: str) -> str:
+    """關鍵字查詢並格式化多筆回覆（單字母關鍵字優先使用預熱的回覆）"""
+    hot_reply = get_hot_keyword_reply(keyword, warehouse_code)
+    if hot_reply is not None:
+        return hot_reply
+    inventory_list = query_cookie_inventory_by_keyword(keyword, warehouse_code)
+    return format_keyword_reply(inventory_list, keyword)
+
+
+# 輸入類型 → 處理函數（預先綁定預設庫別）
+_MESSAGE_HANDLERS = {
+    'code': partial(_handle_code_query, warehouse_code=DEFAULT_WAREHOUSE_CODE),
+    'keyword': partial(_handle_keyword_query, warehouse_code=DEFAULT_WAREHOUSE_CODE),
+}
+
+
 def process_user_message(user_text: str) -> str:
     """
     處理使用者訊息並返回回覆
@@ -436,50 +647,85 @@ def process_user_message(user_text: str) -> str:
         if not input_value:
             return format_error_reply('no_code')
         
-        if input_type == 'code':
-            # 品號查詢
-            inventory_data = query_cookie_inventory(input_value, DEFAULT_WAREHOUSE_CODE)
-            
-            if inventory_data is None:
-                return format_error_reply('not_found', input_value)
-            
-            # 格式化單筆回覆
-            reply = format_inventory_reply(inventory_data)
-            return reply
-        
-        else:
-            # 關鍵字查詢
-            inventory_list = query_cookie_inventory_by_keyword(input_value, DEFAULT_WAREHOUSE_CODE)
-            
-            # 格式化多筆回覆
-            reply = format_keyword_reply(inventory_list, input_value)
-            return reply
+        return _MESSAGE_HANDLERS[input_type](input_value)
         
     except Exception as e:
-        logger.error(f"處理使用者訊息時發生錯誤: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("處理使用者訊息時發生錯誤: %s", e)
         return format_error_reply('system_error')
 
 
+def send_reply(reply_token: str, reply_text: str) -> None:
+    """
+    呼叫 LINE Messaging API 回覆文字訊息
+    
+    Args:
+        reply_token: LINE 回覆用的 replyToken
+        reply_text: 回覆文字
+        
+    Raises:
+        RuntimeError: LINE API 回應非 200
+    """
+    body = json.dumps(
+        {'replyToken': reply_token, 'messages': [{'type': 'text', 'text': reply_text}]},
+        ensure_ascii=False
+    ).encode('utf-8')
+    response = line_http.request('POST', LINE_REPLY_URL, body=body, headers=LINE_REPLY_HEADERS)
+    if response.status != 200:
+        raise RuntimeError(f"LINE API 回覆失敗: HTTP {response.status} {response.data.decode('utf-8', errors='replace')}")
+
+
+def handle_text_message(user_text: str, reply_token: str) -> None:
+    """
+    處理文字訊息並回覆使用者（於背景執行緒中執行）
+    
+    Args:
+        user_text: 使用者輸入的文字
+        reply_token: LINE 回覆用的 replyToken
+    """
+    try:
+        # 處理訊息並產生回覆
+        reply_text = process_user_message(user_text)
+        
+        # 處理訊息長度限制
+        reply_text = truncate_message(reply_text)
+        
+        # 回覆訊息給用戶
+        send_reply(reply_token, reply_text)
+        
+        logger.info("✅ 已回覆使用者")
+    
+    except Exception as e:
+        logger.exception("❌ 回覆使用者時發生錯誤: %s", e)
+
+
 # ==================== Flask 應用程式 ====================
 app = Flask(__name__)
 
+# 背景執行緒池：資料庫查詢與 LINE 回覆（皆為 I/O 等待）可同時處理多則訊息
+REPLY_WORKERS = 8
+reply_executor = ThreadPoolExecutor(max_workers=REPLY_WORKERS, thread_name_prefix='linebot-reply')
+
+# 建立應用程式時即啟動關鍵字預熱（以 WSGI 伺服器載入模組時同樣生效）
+start_hot_keyword_refresher()
+
 
 @app.route("/", methods=["POST"])
 def webhook():
     """處理 LINE Bot webhook"""
     try:
-        # 驗證簽章
-        body = request.get_data(as_text=True)
+        # 驗證簽章（直接使用原始 bytes，只讀取一次且不保留在 request 快取中；以固定時間比較避免時序攻擊）
+        body = request.get_data(cache=False)
         signature = request.headers.get("X-Line-Signature", "")
-        hash = hmac.new(CHANNEL_SECRET.encode(), body.encode(), hashlib.sha256).digest()
+        mac = _SIGNATURE_HMAC.copy()
+        mac.update(body)
+        expected = base64.b64encode(mac.digest())
         
-        if signature != base64.b64encode(hash).decode():
+        if not hmac.compare_digest(expected, signature.encode('ascii', 'ignore')):
             logger.warning("❌ 簽章驗證失敗")
             abort(400)
         
-        # 解析 JSON 資料
-        data = request.get_json()
+        # 解析 JSON 資料（直接使用驗證簽章時已讀取的原始 bytes）
+        data = json.loads(body)
         
         # 確保有事件，且事件類型是訊息，且訊息類型是文字
         if 'events' in data and data['events'] and \
@@ -490,31 +736,15 @@ def webhook():
             user_text = data['events'][0]['message']['text']
             reply_token = data['events'][0]['replyToken']
             
-            logger.info(f"👤 收到使用者訊息: {user_text}")
-            
-            # 處理訊息並產生回覆
-            reply_text = process_user_message(user_text)
-            
-            # 處理訊息長度限制
-            reply_text = truncate_message(reply_text)
-            
-            # 回覆訊息給用戶
-            with ApiClient(configuration) as api_client:
-                messaging_api = MessagingApi(api_client)
-                messaging_api.reply_message_with_http_info(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text=reply_text)]
-                    )
-                )
+            logger.info("👤 收到使用者訊息: %s", user_text)
             
-            logger.info(f"✅ 已回覆使用者")
+            # 查詢與回覆交由背景執行緒處理，webhook 立即回應 LINE 平台
+            reply_executor.submit(handle_text_message, user_text, reply_token)
         
         return "OK", 200
     
     except Exception as e:
-        logger.error(f"❌ Webhook 處理發生錯誤: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("❌ Webhook 處理發生錯誤: %s", e)
         return "Error", 500
 
 
@@ -534,6 +764,7 @@ if __name__ == "__main__":
     print(f"🏢 預設庫別: {DEFAULT_WAREHOUSE_CODE}")
     print(f"🔗 Webhook URL: http://localhost:3001/")
     print(f"📝 日誌檔案: linebot_inventory.log")
+    print(f"🔐 簽章驗證: HMAC-{hashlib.sha256().name.upper()}（{ssl.OPENSSL_VERSION}）")
     print("=" * 60)
     print("💡 使用說明:")
     print("   使用者可輸入品號查詢庫存")
@@ -542,10 +773,9 @@ if __name__ == "__main__":
     print("=" * 60)
     
     try:
-        app.run(host='0.0.0.0', port=3001, debug=False)
+        app.run(host='0.0.0.0', port=3001, debug=False, threaded=True)
     except KeyboardInterrupt:
         print("\n👋 系統已停止")
     except Exception as e:
-        logger.error(f"系統啟動失敗: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("系統啟動失敗: %s", e)
         sys.exit(1)
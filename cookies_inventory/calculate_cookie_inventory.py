@@ -8,10 +8,17 @@
 執行流程：
 1. 確認已經手動更新當天 Google Sheets 中的「實盤庫存」工作表
 2. 執行此程式計算未來14天的庫存預估"""
+import hashlib
+import json
+import os
+import re
+import shutil
 import sys
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import List, Dict, Set, Any, Tuple, Union, Optional
 from collections import defaultdict
+from functools import lru_cache
+from operator import itemgetter
 from .google_sheets_helper import GoogleSheetsHelper
 import logging
 
@@ -23,51 +30,91 @@ LEAD_TIME_DAYS = 2
 # 預計計算天數（預計計算未來21天庫存預估）
 FORECAST_DAYS = 21
 
+# 計算所需讀取的工作表與欄位範圍（以單一批次請求讀取，只取用到的欄位）
+INPUT_WORKSHEETS = {
+    '實盤庫存': 'A:D',   # 餅乾代號、餅乾品名、目前庫存數量、庫別代號
+    'Index': 'A:C',      # 類型、代號、名稱
+    'BOM': 'A:C',        # 禮盒代號、餅乾代號、每盒片數
+    '生產排程': 'A:G',   # 日期、產線代號、餅乾代號、名稱、生產顆數、生產片數、預計完成日期
+    '組裝計劃': 'A:C',   # 日期、禮盒代號、計畫組裝數量
+}
+
+# 讀取輸入工作表時不套用顯示格式：數字直接為 int/float、日期為序列值，省去字串解析
+INPUT_VALUE_RENDER_OPTION = 'UNFORMATTED_VALUE'
+# Google Sheets 日期序列值的起算日（序列值 0 = 1899/12/30）
+SHEETS_EPOCH = date(1899, 12, 30)
+
+# 工作表快照快取目錄（以 --cache 執行時，同一天重複執行直接讀取本機快照，不再呼叫 Google Sheets API）
+# 固定放在本套件目錄下，不受執行時的工作目錄影響
+SNAPSHOT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'snapshots')
+# 快照日期子目錄名稱（YYYYMMDD）；清除舊快照時只刪除符合此格式的目錄
+SNAPSHOT_DAY_DIR_PATTERN = re.compile(r'\d{8}')
+
 # 庫存預估明細工作表標題
 INVENTORY_DETAIL_HEADERS = ['日期', '餅乾代號', '餅乾品名', '期初庫存', '當天組裝需求', '預估入庫數量', '期末庫存', '是否負庫存', '缺口數量', '更新日期']
-def parse_date(date_str: Any) -> Optional[datetime]:
+def parse_date(date_str: Any) -> Optional[date]:
     """解析日期字串（Google Sheets 格式：YYYY/M/D 或 YYYY/MM/DD）
     支援格式：YYYY/M/D（單數月份和日期，例如：2025/1/5）、YYYY/MM/DD（雙數月份和日期，例如：2025/01/05）
+    另支援 UNFORMATTED_VALUE 讀取時的日期序列值（數字，1899/12/30 起算的天數）
     Args:date_str: 日期字串
-    Returns: datetime 物件（時間設為00:00:00，只保留日期部分），無法解析則返回 None"""
-    if isinstance(date_str, datetime):
-        return normalize_date(date_str)
+    Returns: date 物件（只保留日期部分），無法解析則返回 None"""
+    # 以 type() 比對型別（bool 不會被當成序列值）
+    value_type = type(date_str)
+    if value_type is datetime:
+        return date_str.date()
+    if value_type is date:
+        return date_str
+    if value_type is int or value_type is float:
+        return _parse_date_serial(int(date_str))
     if not date_str:
         return None
-    date_str = str(date_str).strip()
+    return _parse_date_string(str(date_str).strip())
+
+@lru_cache(maxsize=4096)
+def _parse_date_string(date_str: str) -> Optional[date]:
+    """解析已去除空白的日期字串（以 lru_cache 快取：排程中大量列共用少數日期，同一字串只解析一次）"""
     try:
         parts = date_str.split('/')
         if len(parts) == 3:
             year, month, day = int(parts[0]), int(parts[1]), int(parts[2])
-            return normalize_date(datetime(year, month, day))
+            return date(year, month, day)
     except (ValueError, IndexError):
         pass    
     logger.warning(f"無法解析日期（期望格式：YYYY/M/D 或 YYYY/MM/DD）: {date_str}")
     return None
 
-def normalize_date(date: datetime) -> datetime:
-    """標準化日期（只取日期部分，時間設為00:00:00）"""
-    return datetime(date.year, date.month, date.day)
+@lru_cache(maxsize=4096)
+def _parse_date_serial(serial: int) -> Optional[date]:
+    """將 Google Sheets 日期序列值轉換為 date（小數部分為時間，直接捨去）"""
+    if serial <= 0:
+        return None
+    return SHEETS_EPOCH + timedelta(days=serial)
 
-def get_today_date() -> datetime:
-    """取得今天的日期（只取日期部分，時間設為00:00:00）"""
-    return normalize_date(datetime.now())
+def get_today_date() -> date:
+    """取得今天的日期（date 物件，只有日期部分）"""
+    return date.today()
 
-def get_header_index(headers: List[str], header_name: str, default: int = 0) -> int:
-    """取得標題欄位索引
-    Args: headers: 標題行列表, header_name: 欄位名稱, default: 預設索引（如果找不到欄位）
-    Returns: 欄位索引"""
-    return headers.index(header_name) if header_name in headers else default
+def build_header_index(headers: List[str]) -> Dict[str, int]:
+    """建立標題欄位索引對應表（重複欄位名稱以第一個出現的位置為準）
+    Args: headers: 標題行列表
+    Returns: 字典：{欄位名稱: 欄位索引}，之後以 .get(欄位名稱, 預設索引) 查詢"""
+    header_index = {}
+    for idx, name in enumerate(headers):
+        header_index.setdefault(name, idx)
+    return header_index
 
-def format_date(date: Optional[datetime]) -> str:
+def format_date(date: Optional[date]) -> str:
     """格式化日期為 YYYY/MM/DD 字串
-    Args: date: datetime 物件或 None
+    Args: date: date 物件或 None
     Returns: 日期字串（格式：YYYY/MM/DD），如果為 None 則返回空字串"""
     return date.strftime('%Y/%m/%d') if date else ''
 
+# 移除千分位逗號用的轉換表（str.translate 在 C 層一次處理整個字串）
+_COMMA_TRANS = str.maketrans('', '', ',')
+
 def _parse_numeric_string(value_str: str) -> str:
-    """移除千分位逗號並清理字串"""
-    return value_str.replace(',', '').strip()
+    """移除千分位逗號（呼叫端已 strip；float() 本身可容忍前後空白，不需再 strip）"""
+    return value_str.translate(_COMMA_TRANS)
 
 def parse_number(value: Any) -> int:
     """將文字轉換為整數，處理千分位逗號格式    
@@ -76,9 +123,11 @@ def parse_number(value: Any) -> int:
     Returns:轉換後的整數，如果無法轉換則返回 0 """
     if value is None:
         return 0
-    if isinstance(value, int):
+    # 以 type() 比對型別：bool 不視為數字（True 不會變成 1）
+    value_type = type(value)
+    if value_type is int:
         return value
-    if isinstance(value, float):
+    if value_type is float:
         return int(value)    
     value_str = str(value).strip()
     if not value_str:
@@ -96,7 +145,8 @@ def parse_float(value: Any) -> float:
     Returns:轉換後的浮點數，如果無法轉換則返回 0.0"""
     if value is None:
         return 0.0
-    if isinstance(value, (int, float)):
+    value_type = type(value)
+    if value_type is int or value_type is float:
         return float(value)    
     value_str = str(value).strip()
     if not value_str:
@@ -107,93 +157,113 @@ def parse_float(value: Any) -> float:
         logger.warning(f"無法將 '{value}' 轉換為浮點數，使用 0.0")
         return 0.0
 
-def read_initial_inventory(sheets_helper: GoogleSheetsHelper) -> Dict[str, int]:
+def read_initial_inventory(inventory_data: List[List[Any]]) -> Dict[str, int]:
     """讀取今天的期初庫存（從Google Sheets讀取「實盤庫存」工作表）
     說明：
-    - 此函數從Google Sheets讀取「實盤庫存」工作表
+    - 此函數處理從Google Sheets讀取的「實盤庫存」工作表資料
     - 此工作表的資料就是今天的期初庫存數量（例如：1/5的期初庫存）
     - 此工作表的資料應該已經過手動調整（可能先從ERP同步，再手動修改）
     - 多庫別（SP40, SP50, SP60, SP80）會按餅乾代號合併加總
     - 會處理千分位逗號格式的數字（例如："1,000"）
     - 包括負庫存數量也會正確處理和加總
-    Args: sheets_helper: Google Sheets 輔助物件    
+    Args: inventory_data: 「實盤庫存」工作表資料（二維列表）
     Returns: 字典：{餅乾代號: 庫存數量（整數）} - 今天的期初庫存"""
     logger.info("從Google Sheets讀取今天的期初庫存（從「實盤庫存」工作表）...")
     inventory = defaultdict(int)    
     # 讀取實盤庫存工作表（多庫別需要按餅乾代號合併加總）
     try:
-        inventory_data = sheets_helper.read_worksheet('實盤庫存')
         if len(inventory_data) > 1:
-            headers = inventory_data[0]
+            header_index = build_header_index(inventory_data[0])
             # 找到欄位索引（新格式：餅乾代號、餅乾品名、目前庫存數量、庫別代號、單位、最後更新日期）
-            code_idx = get_header_index(headers, '餅乾代號', 0)
-            qty_idx = get_header_index(headers, '目前庫存數量', 2)
-            warehouse_idx = get_header_index(headers, '庫別代號', 3)
+            code_idx = header_index.get('餅乾代號', 0)
+            qty_idx = header_index.get('目前庫存數量', 2)
+            warehouse_idx = header_index.get('庫別代號', 3)
             
             processed_count = 0
             skipped_count = 0
-            for row in inventory_data[1:]:
-                if len(row) > max(code_idx, qty_idx):
-                    cookie_code = str(row[code_idx]).strip() if row[code_idx] else ''
-                    if not cookie_code:
-                        skipped_count += 1
-                        continue
-                    qty = parse_number(row[qty_idx])
-                    warehouse_code = str(row[warehouse_idx]).strip() if len(row) > warehouse_idx and row[warehouse_idx] else ''
-                    inventory[cookie_code] += qty
-                    processed_count += 1
-                    
-                    # 記錄詳細資訊（僅在 debug 模式下）
-                    if qty != 0:
-                        logger.debug(f"  餅乾代號: {cookie_code}, 庫別代號: {warehouse_code}, 庫存數量: {qty}")
+            min_row_len = max(code_idx, qty_idx) + 1
+            # 以 itemgetter 一次取出所需欄位
+            get_cols = itemgetter(code_idx, qty_idx)
+            rows = [row for row in inventory_data[1:] if len(row) >= min_row_len]
+            for row in rows:
+                code_value, qty_value = get_cols(row)
+                cookie_code = str(code_value).strip() if code_value else ''
+                if not cookie_code:
+                    skipped_count += 1
+                    continue
+                qty = parse_number(qty_value)
+                warehouse_code = str(row[warehouse_idx]).strip() if len(row) > warehouse_idx and row[warehouse_idx] else ''
+                inventory[cookie_code] += qty
+                processed_count += 1
+                
+                # 記錄詳細資訊（僅在 debug 模式下）
+                if qty != 0:
+                    logger.debug(f"  餅乾代號: {cookie_code}, 庫別代號: {warehouse_code}, 庫存數量: {qty}")
             
             logger.info(f"處理了 {processed_count} 筆庫存記錄，跳過 {skipped_count} 筆（無餅乾代號）")
             logger.info(f"從「實盤庫存」工作表讀取到 {len(inventory)} 種餅乾的庫存（已按餅乾代號合併加總）")
     except Exception as e:
-        logger.warning(f"讀取「實盤庫存」工作表失敗: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.warning(f"讀取「實盤庫存」工作表失敗: {e}", exc_info=True)
     
     # 保留所有餅乾代號（包括數量為0的，因為可能後續有生產或需求）
     result = dict(inventory)
     if result:
-        total_qty = sum(result.values())
-        positive_count = sum(1 for v in result.values() if v > 0)
-        negative_count = sum(1 for v in result.values() if v < 0)
-        zero_count = sum(1 for v in result.values() if v == 0)
+        # 單次走訪同時統計總數量與正/負/零庫存種類數
+        total_qty = positive_count = negative_count = zero_count = 0
+        for qty in result.values():
+            total_qty += qty
+            if qty > 0:
+                positive_count += 1
+            elif qty < 0:
+                negative_count += 1
+            else:
+                zero_count += 1
         logger.info(f"今天的期初庫存總計：{positive_count} 種餅乾有正庫存，{negative_count} 種餅乾有負庫存，{zero_count} 種餅乾為零庫存，總數量：{total_qty} 片")
     return result
 
-def read_bom(sheets_helper: GoogleSheetsHelper) -> Dict[str, Dict[str, float]]:
+def read_bom(bom_data: List[List[Any]]) -> Dict[str, Dict[str, float]]:
     """讀取BOM表（禮盒組成表）
-    Args: sheets_helper: Google Sheets 輔助物件
+    Args: bom_data: 「BOM」工作表資料（二維列表）
     Returns: 字典：{禮盒代號: {餅乾代號: 每盒片數, ...}}"""
     logger.info("讀取BOM表...")
-    bom = defaultdict(lambda: defaultdict(float))
+    bom: Dict[str, Dict[str, float]] = {}
     try:
-        bom_data = sheets_helper.read_worksheet('BOM')
         if len(bom_data) > 1:
-            headers = bom_data[0]
-            box_code_idx = get_header_index(headers, '禮盒代號', 0)
-            cookie_code_idx = get_header_index(headers, '餅乾代號', 1)
-            qty_idx = get_header_index(headers, '每盒片數', 2)            
-            for row in bom_data[1:]:
-                if len(row) > max(box_code_idx, cookie_code_idx, qty_idx):
-                    box_code = str(row[box_code_idx]).strip()
-                    cookie_code = str(row[cookie_code_idx]).strip()
-                    try:
-                        qty = parse_float(row[qty_idx])
-                        if box_code and cookie_code and qty > 0:
-                            bom[box_code][cookie_code] = qty
-                    except (ValueError, TypeError):
-                        continue            
+            header_index = build_header_index(bom_data[0])
+            box_code_idx = header_index.get('禮盒代號', 0)
+            cookie_code_idx = header_index.get('餅乾代號', 1)
+            qty_idx = header_index.get('每盒片數', 2)            
+            min_row_len = max(box_code_idx, cookie_code_idx, qty_idx) + 1
+            get_cols = itemgetter(box_code_idx, cookie_code_idx, qty_idx)
+            rows = [row for row in bom_data[1:] if len(row) >= min_row_len]
+            for row in rows:
+                box_value, code_value, qty_value = get_cols(row)
+                box_code = str(box_value).strip()
+                cookie_code = str(code_value).strip()
+                try:
+                    qty = parse_float(qty_value)
+                    if box_code and cookie_code and qty > 0:
+                        bom.setdefault(box_code, {})[cookie_code] = qty
+                except (ValueError, TypeError):
+                    continue            
             logger.info(f"讀取到 {len(bom)} 種禮盒的BOM資料")
     except Exception as e:
         logger.error(f"讀取BOM表失敗: {e}")
         raise    
-    return dict(bom)
+    return bom
+
+def group_by_date(quantities: Dict[Tuple[date, str], float]) -> Tuple[Dict[date, Dict[str, float]], Set[str]]:
+    """將扁平的 {(日期, 餅乾代號): 數量} 依日期分組，同時收集出現過的餅乾代號
+    Args: quantities: 以 (日期, 餅乾代號) 為鍵的數量字典
+    Returns: (字典：{日期: {餅乾代號: 數量, ...}}, 餅乾代號集合)"""
+    grouped: Dict[date, Dict[str, float]] = {}
+    cookie_codes: Set[str] = set()
+    for (date_key, cookie_code), qty in quantities.items():
+        grouped.setdefault(date_key, {})[cookie_code] = qty
+        cookie_codes.add(cookie_code)
+    return grouped, cookie_codes
 
-def read_production_schedule(sheets_helper: GoogleSheetsHelper, today: datetime) -> Dict[datetime, Dict[str, float]]:
+def read_production_schedule(schedule_data: List[List[Any]], today: date) -> Tuple[Dict[date, Dict[str, float]], Set[str]]:
     """讀取生產排程（包含今天及前3天的投料）
     
     說明：
@@ -207,71 +277,77 @@ def read_production_schedule(sheets_helper: GoogleSheetsHelper, today: datetime)
     - 例如：今天是1/5，則要計算1/2投料、1/3投料、1/4投料和1/5投料分別加入到對應的完工入庫日期
     
     Args:
-        sheets_helper: Google Sheets 輔助物件
+        schedule_data: 「生產排程」工作表資料（二維列表）
         today: 今天的日期
     
     Returns:
-        字典：{完工入庫日期: {餅乾代號: 生產數量（片）, ...}}
+        (字典：{完工入庫日期: {餅乾代號: 生產數量（片）, ...}}, 生產排程中出現的餅乾代號集合)
     """
     logger.info("讀取生產排程（包含今天及前3天的投料）...")
-    production = defaultdict(lambda: defaultdict(float))
-    min_production_date = today.date() - timedelta(days=3)
+    # 以 (完工入庫日期, 餅乾代號) 為鍵的扁平字典累加，每筆只需一次雜湊查詢
+    production: Dict[Tuple[date, str], float] = {}
+    min_production_date = today - timedelta(days=3)
+    # 預設完工日期的前置天數只建立一次，不在每一列重新建立 timedelta
+    lead_time = timedelta(days=LEAD_TIME_DAYS)
     
     try:
-        schedule_data = sheets_helper.read_worksheet('生產排程')
         if len(schedule_data) > 1:
-            headers = schedule_data[0]
+            header_index = build_header_index(schedule_data[0])
             # 讀取必要的欄位：日期、餅乾代號、生產片數、預計完成日期
-            date_idx = get_header_index(headers, '日期', 0)
-            cookie_code_idx = get_header_index(headers, '餅乾代號', 2)
-            pieces_qty_idx = get_header_index(headers, '生產片數', 5)
-            completion_date_idx = get_header_index(headers, '預計完成日期', -1)
+            date_idx = header_index.get('日期', 0)
+            cookie_code_idx = header_index.get('餅乾代號', 2)
+            pieces_qty_idx = header_index.get('生產片數', 5)
+            completion_date_idx = header_index.get('預計完成日期', -1)
             
             skipped_before_min_date = 0
             skipped_no_pieces = 0
             used_custom_date_count = 0
             used_default_date_count = 0
             
-            for row in schedule_data[1:]:
-                if len(row) > max(date_idx, cookie_code_idx, pieces_qty_idx):
-                    # 解析投料日期
-                    production_date = parse_date(row[date_idx])
-                    if not production_date:
-                        continue
-                    # 只讀取投料日期 >= (今天 - 3天) 的記錄
-                    if production_date.date() < min_production_date:
-                        skipped_before_min_date += 1
-                        continue
-                    
-                    cookie_code = str(row[cookie_code_idx]).strip() if row[cookie_code_idx] else ''
-                    if not cookie_code:
-                        continue
-                    
-                    try:
-                        qty_pieces = parse_float(row[pieces_qty_idx])
-                        if qty_pieces > 0:
-                            # 判斷是否使用指定的預計完成日期
-                            if completion_date_idx >= 0 and completion_date_idx < len(row) and row[completion_date_idx]:
-                                # 如果有指定預計完成日期，使用該日期
-                                custom_completion_date = parse_date(row[completion_date_idx])
-                                if custom_completion_date:
-                                    completion_date = normalize_date(custom_completion_date)
-                                    used_custom_date_count += 1
-                                else:
-                                    # 如果解析失敗，使用預設值
-                                    completion_date = normalize_date(production_date + timedelta(days=LEAD_TIME_DAYS))
-                                    used_default_date_count += 1
+            min_row_len = max(date_idx, cookie_code_idx, pieces_qty_idx) + 1
+            get_cols = itemgetter(date_idx, cookie_code_idx, pieces_qty_idx)
+            rows = [row for row in schedule_data[1:] if len(row) >= min_row_len]
+            for row in rows:
+                date_value, code_value, qty_value = get_cols(row)
+                # 解析投料日期
+                production_date = parse_date(date_value)
+                if not production_date:
+                    continue
+                # 只讀取投料日期 >= (今天 - 3天) 的記錄
+                if production_date < min_production_date:
+                    skipped_before_min_date += 1
+                    continue
+                
+                cookie_code = str(code_value).strip() if code_value else ''
+                if not cookie_code:
+                    continue
+                
+                try:
+                    qty_pieces = parse_float(qty_value)
+                    if qty_pieces > 0:
+                        # 判斷是否使用指定的預計完成日期
+                        if completion_date_idx >= 0 and completion_date_idx < len(row) and row[completion_date_idx]:
+                            # 如果有指定預計完成日期，使用該日期
+                            custom_completion_date = parse_date(row[completion_date_idx])
+                            if custom_completion_date:
+                                completion_date = custom_completion_date
+                                used_custom_date_count += 1
                             else:
-                                # 如果預計完成日期為空白，使用預設值：投料日期 + 2天
-                                completion_date = normalize_date(production_date + timedelta(days=LEAD_TIME_DAYS))
+                                # 如果解析失敗，使用預設值
+                                completion_date = production_date + lead_time
                                 used_default_date_count += 1
-                            
-                            production[completion_date][cookie_code] += qty_pieces
                         else:
-                            skipped_no_pieces += 1
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"解析生產排程資料失敗（餅乾代號：{cookie_code}）: {e}")
-                        continue
+                            # 如果預計完成日期為空白，使用預設值：投料日期 + 2天
+                            completion_date = production_date + lead_time
+                            used_default_date_count += 1
+                        
+                        key = (completion_date, cookie_code)
+                        production[key] = production.get(key, 0.0) + qty_pieces
+                    else:
+                        skipped_no_pieces += 1
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"解析生產排程資料失敗（餅乾代號：{cookie_code}）: {e}")
+                    continue
             
             if skipped_before_min_date > 0:
                 logger.info(f"已排除 {min_production_date} 之前的投料記錄 {skipped_before_min_date} 筆")
@@ -281,147 +357,119 @@ def read_production_schedule(sheets_helper: GoogleSheetsHelper, today: datetime)
                 logger.info(f"使用指定預計完成日期：{used_custom_date_count} 筆")
             if used_default_date_count > 0:
                 logger.info(f"使用預設完工日期（投料日期+2天）：{used_default_date_count} 筆")
-            logger.info(f"讀取到 {len(production)} 天的生產排程（已轉換為完工入庫日期）")
+            logger.info(f"讀取到 {len({date_key for date_key, _ in production})} 天的生產排程（已轉換為完工入庫日期）")
     except Exception as e:
         logger.error(f"讀取生產排程失敗: {e}")
         raise
-    return dict(production)
+    return group_by_date(production)
 
 
-def read_assembly_schedule(sheets_helper: GoogleSheetsHelper, bom: Dict[str, Dict[str, float]]) -> Dict[datetime, Dict[str, float]]:
+def read_assembly_schedule(assembly_data: List[List[Any]], bom: Dict[str, Dict[str, float]]) -> Tuple[Dict[date, Dict[str, float]], Set[str]]:
     """讀取組裝排程並展開為餅乾需求量    
-    Args:sheets_helper: Google Sheets 輔助物件,bom: BOM表字典
-    Returns:字典：{組裝日期: {餅乾代號: 需求量, ...}}"""
+    Args:assembly_data: 「組裝計劃」工作表資料（二維列表）,bom: BOM表字典
+    Returns:(字典：{組裝日期: {餅乾代號: 需求量, ...}}, 組裝需求中出現的餅乾代號集合)"""
     logger.info("讀取組裝排程...")
-    assembly = defaultdict(lambda: defaultdict(float))    
+    # 以 (組裝日期, 餅乾代號) 為鍵的扁平字典累加，每筆只需一次雜湊查詢
+    assembly: Dict[Tuple[date, str], float] = {}
     try:
-        assembly_data = sheets_helper.read_worksheet('組裝計劃')
         if len(assembly_data) > 1:
-            headers = assembly_data[0]
-            date_idx = get_header_index(headers, '日期', 0)
-            box_code_idx = get_header_index(headers, '禮盒代號', 1)
-            qty_idx = get_header_index(headers, '計畫組裝數量', 2)
-            for row in assembly_data[1:]:
-                if len(row) > max(date_idx, box_code_idx, qty_idx):
-                    # 解析組裝日期
-                    assembly_date = parse_date(row[date_idx])
-                    if not assembly_date:
-                        continue                    
-                    box_code = str(row[box_code_idx]).strip()
-                    try:
-                        box_qty = parse_float(row[qty_idx])
-                        if box_code and box_qty > 0:
-                            assembly_date_key = normalize_date(assembly_date)
-                            # 使用BOM表展開為餅乾需求量
-                            if box_code in bom:
-                                for cookie_code, pieces_per_box in bom[box_code].items():
-                                    cookie_qty = box_qty * pieces_per_box
-                                    assembly[assembly_date_key][cookie_code] += cookie_qty
-                            else:
-                                logger.warning(f"禮盒 {box_code} 在BOM表中找不到")
-                    except (ValueError, TypeError):
-                        continue            
-            logger.info(f"讀取到 {len(assembly)} 天的組裝排程（已展開為餅乾需求）")
+            header_index = build_header_index(assembly_data[0])
+            date_idx = header_index.get('日期', 0)
+            box_code_idx = header_index.get('禮盒代號', 1)
+            qty_idx = header_index.get('計畫組裝數量', 2)
+            # 先按 (組裝日期, 禮盒代號) 合計盒數，每個組合只展開一次BOM
+            box_totals: Dict[Tuple[date, str], float] = {}
+            min_row_len = max(date_idx, box_code_idx, qty_idx) + 1
+            get_cols = itemgetter(date_idx, box_code_idx, qty_idx)
+            rows = [row for row in assembly_data[1:] if len(row) >= min_row_len]
+            for row in rows:
+                date_value, box_value, qty_value = get_cols(row)
+                # 解析組裝日期
+                assembly_date = parse_date(date_value)
+                if not assembly_date:
+                    continue                    
+                box_code = str(box_value).strip()
+                try:
+                    box_qty = parse_float(qty_value)
+                    if box_code and box_qty > 0:
+                        if box_code in bom:
+                            key = (assembly_date, box_code)
+                            box_totals[key] = box_totals.get(key, 0.0) + box_qty
+                        else:
+                            logger.warning(f"禮盒 {box_code} 在BOM表中找不到")
+                except (ValueError, TypeError):
+                    continue            
+            # 使用BOM表展開為餅乾需求量
+            for (assembly_date, box_code), box_qty in box_totals.items():
+                for cookie_code, pieces_per_box in bom[box_code].items():
+                    key = (assembly_date, cookie_code)
+                    assembly[key] = assembly.get(key, 0.0) + box_qty * pieces_per_box
+            logger.info(f"讀取到 {len({date_key for date_key, _ in assembly})} 天的組裝排程（已展開為餅乾需求）")
     except Exception as e:
         logger.error(f"讀取組裝排程失敗: {e}")
         raise    
-    return dict(assembly)
+    return group_by_date(assembly)
 
 def get_all_cookie_codes(
     initial_inventory: Dict[str, float],
-    production_schedule: Dict[datetime, Dict[str, float]],
-    assembly_schedule: Dict[datetime, Dict[str, float]]
-) -> Set[str]:
-    """取得所有需要計算的餅乾代號集合    
-    Args: initial_inventory: 期初庫存, production_schedule: 生產排程（完工入庫日期）, assembly_schedule: 組裝排程（餅乾需求量）
-    Returns: 所有餅乾代號的集合"""
-    all_cookies = set(initial_inventory.keys())
-    for schedule in production_schedule.values():
-        all_cookies.update(schedule.keys())
-    for schedule in assembly_schedule.values():
-        all_cookies.update(schedule.keys())
-    return all_cookies
+    production_schedule: Dict[date, Dict[str, float]],
+    assembly_schedule: Dict[date, Dict[str, float]],
+    schedule_codes: Optional[Set[str]] = None
+) -> List[str]:
+    """取得所有需要計算的餅乾代號（已排序，整個計算只排序一次）    
+    Args: initial_inventory: 期初庫存, production_schedule: 生產排程（完工入庫日期）, assembly_schedule: 組裝排程（餅乾需求量）, schedule_codes: 讀取排程時已收集的餅乾代號（可選，提供時不再走訪排程）
+    Returns: 依代號排序的餅乾代號列表"""
+    if schedule_codes is not None:
+        return sorted(schedule_codes.union(initial_inventory))
+    return sorted(set(initial_inventory).union(
+        *production_schedule.values(),
+        *assembly_schedule.values()
+    ))
 
-def calculate_daily_inventory(
-    date: datetime,
-    cookie_code: str,
-    current_inventory: Dict[str, float],
-    production_schedule: Dict[datetime, Dict[str, float]],
-    assembly_schedule: Dict[datetime, Dict[str, float]]
-) -> Tuple[float, float, float, float]:
-    """計算單一餅乾在特定日期的庫存變化
+def apply_daily_changes(
+    inventory: List[float],
+    cookie_index: Dict[str, int],
+    completions: Dict[str, float],
+    demands: Dict[str, float]
+) -> Tuple[List[float], List[float], List[float]]:
+    """套用單日的入庫與組裝需求（以餅乾代號排序位置為索引的平行陣列），只計算當天有異動的餅乾
     
     計算邏輯：
     - 期初庫存 = 前一天的期末庫存（第一天使用從「實盤庫存」工作表讀取的期初庫存）
     - 當天組裝需求量 = 從組裝排程取得的當天組裝計劃所需的餅乾數量
     - 當天完工入庫數量 = 從生產排程取得的當天預計要完工入庫的餅乾數量（生產排程日期 + 2天 = 完工入庫日期）
     - 期末庫存 = 期初庫存 - 當天組裝計劃所需的餅乾 + 當天預計要完工入庫的餅乾
-    - 當天的期末庫存會轉為明天的期初庫存
-    
-    Args:
-        date: 計算日期
-        cookie_code: 餅乾代號
-        current_inventory: 當前庫存狀態（會更新，作為下一天的期初庫存）
-        production_schedule: 生產排程（完工入庫日期: {餅乾代號: 生產數量}）
-        assembly_schedule: 組裝排程（組裝日期: {餅乾代號: 需求量}）
-    
-    Returns:
-        (期初庫存, 預估入庫數量, 當天組裝需求, 期末庫存)
-    """
-    date_key = normalize_date(date)
-    beginning_qty = current_inventory.get(cookie_code, 0.0)
-    demand_qty = assembly_schedule.get(date_key, {}).get(cookie_code, 0.0)
-    completion_qty = production_schedule.get(date_key, {}).get(cookie_code, 0.0)
-    ending_qty = beginning_qty - demand_qty + completion_qty
-    current_inventory[cookie_code] = ending_qty
-    return beginning_qty, completion_qty, demand_qty, ending_qty
-
-def create_detail_row(
-    date: datetime,
-    cookie_code: str,
-    cookie_name: str,
-    beginning_qty: float,
-    completion_qty: float,
-    demand_qty: float,
-    ending_qty: float,
-    update_date: str = ''
-) -> List[Any]:
-    """建立庫存明細記錄
+    - 當天沒有入庫也沒有需求的餅乾，期末庫存等於期初庫存，不需要計算
     
     Args:
-        date: 日期
-        cookie_code: 餅乾代號
-        cookie_name: 餅乾品名
-        beginning_qty: 期初庫存
-        completion_qty: 預估入庫數量
-        demand_qty: 當天組裝需求
-        ending_qty: 期末庫存
-        update_date: 更新日期（格式：YYYY-MM-DD HH:MM:SS）
+        inventory: 各餅乾目前庫存（會就地更新為當天期末庫存，作為下一天的期初庫存）
+        cookie_index: {餅乾代號: 陣列索引}
+        completions: 當天的預估入庫數量 {餅乾代號: 數量}
+        demands: 當天的組裝需求 {餅乾代號: 數量}
     
     Returns:
-        明細記錄列表
+        (期初庫存陣列, 預估入庫數量陣列, 當天組裝需求陣列)，與 inventory 同樣以餅乾代號排序位置為索引
     """
-    shortage_qty = abs(ending_qty) if ending_qty < 0 else 0.0
-    return [
-        format_date(date),
-        cookie_code,
-        cookie_name,
-        beginning_qty,
-        demand_qty,
-        completion_qty,
-        ending_qty,
-        '是' if ending_qty < 0 else '否',
-        shortage_qty,
-        update_date
-    ]
+    beginning = inventory[:]
+    completion_qtys = [0.0] * len(inventory)
+    demand_qtys = [0.0] * len(inventory)
+    for cookie_code, qty in completions.items():
+        completion_qtys[cookie_index[cookie_code]] = qty
+    for cookie_code, qty in demands.items():
+        demand_qtys[cookie_index[cookie_code]] = qty
+    for cookie_code in completions.keys() | demands.keys():
+        idx = cookie_index[cookie_code]
+        inventory[idx] = beginning[idx] - demand_qtys[idx] + completion_qtys[idx]
+    return beginning, completion_qtys, demand_qtys
 
 def calculate_inventory_forecast(
     initial_inventory: Dict[str, Union[int, float]],
-    production_schedule: Dict[datetime, Dict[str, float]],
-    assembly_schedule: Dict[datetime, Dict[str, float]],
-    today: datetime,
+    production_schedule: Dict[date, Dict[str, float]],
+    assembly_schedule: Dict[date, Dict[str, float]],
+    today: date,
     cookie_names: Dict[str, str],
-    update_date: str = ''
+    update_date: str = '',
+    schedule_codes: Optional[Set[str]] = None
 ) -> List[List[Any]]:
     """計算未來14天的庫存預估    
     計算邏輯：
@@ -434,61 +482,98 @@ def calculate_inventory_forecast(
       * 當天的期末庫存會轉為明天的期初庫存（迭代計算）
     - 在明細記錄中包含「是否負庫存」和「缺口數量」欄位
     - 在明細記錄的最後一欄包含「更新日期」
-    Args: initial_inventory: 期初庫存（從「實盤庫存」工作表讀取的今天的期初庫存）, production_schedule: 生產排程（完工入庫日期: {餅乾代號: 生產數量}，生產排程日期 + 2天 = 完工入庫日期）, assembly_schedule: 組裝排程（組裝日期: {餅乾代號: 需求量}）, today: 今天的日期, cookie_names: 餅乾名稱對應表, update_date: 更新日期（格式：YYYY-MM-DD HH:MM:SS）
+    Args: initial_inventory: 期初庫存（從「實盤庫存」工作表讀取的今天的期初庫存）, production_schedule: 生產排程（完工入庫日期: {餅乾代號: 生產數量}，生產排程日期 + 2天 = 完工入庫日期）, assembly_schedule: 組裝排程（組裝日期: {餅乾代號: 需求量}）, today: 今天的日期, cookie_names: 餅乾名稱對應表, update_date: 更新日期（格式：YYYY-MM-DD HH:MM:SS）, schedule_codes: 讀取排程時已收集的餅乾代號（可選）
     Returns: 庫存明細列表"""
     logger.info(f"開始計算未來 {FORECAST_DAYS} 天的庫存預估（前置天數：{LEAD_TIME_DAYS} 天）...")
     
     detail_rows = []
     
     # 取得所有需要計算的餅乾代號
-    all_cookies = get_all_cookie_codes(initial_inventory, production_schedule, assembly_schedule)
-    logger.info(f"需要計算的餅乾種類：{len(all_cookies)} 種")
+    sorted_cookies = get_all_cookie_codes(initial_inventory, production_schedule, assembly_schedule, schedule_codes)
+    logger.info(f"需要計算的餅乾種類：{len(sorted_cookies)} 種")
     
-    current_inventory = {k: float(v) for k, v in initial_inventory.items()}
+    # 以餅乾代號排序位置為索引的平行陣列（SoA）保存每種餅乾的庫存，逐日就地更新
+    # 期初庫存為整數片數；生產片數（小數兩位）與BOM每盒片數可能有小數，計算時統一轉為 float
+    cookie_index = {cookie_code: idx for idx, cookie_code in enumerate(sorted_cookies)}
+    inventory = [float(initial_inventory.get(cookie_code, 0.0)) for cookie_code in sorted_cookies]
+    cookie_name_list = [cookie_names.get(cookie_code, '') for cookie_code in sorted_cookies]
     
     for day_offset in range(FORECAST_DAYS):
         date = today + timedelta(days=day_offset)
-        for cookie_code in sorted(all_cookies):
-            beginning_qty, completion_qty, demand_qty, ending_qty = calculate_daily_inventory(
-                date, cookie_code, current_inventory, production_schedule, assembly_schedule
-            )
-            
-            cookie_name = cookie_names.get(cookie_code, '')
-            detail_rows.append(create_detail_row(
-                date, cookie_code, cookie_name,
-                beginning_qty, completion_qty, demand_qty, ending_qty,
+        date_str = format_date(date)
+        # 只更新當天有入庫或需求的餅乾，其餘餅乾庫存原樣延續
+        beginning, completion_qtys, demand_qtys = apply_daily_changes(
+            inventory,
+            cookie_index,
+            production_schedule.get(date, {}),
+            assembly_schedule.get(date, {})
+        )
+        # 依餅乾代號順序輸出當天完整明細，欄位順序同 INVENTORY_DETAIL_HEADERS：
+        # 日期、餅乾代號、餅乾品名、期初庫存、當天組裝需求、預估入庫數量、期末庫存、是否負庫存、缺口數量、更新日期
+        detail_rows.extend([
+            [
+                date_str, cookie_code, cookie_name,
+                beginning_qty, demand_qty, completion_qty, ending_qty,
+                '是' if ending_qty < 0 else '否',
+                -ending_qty if ending_qty < 0 else 0.0,
                 update_date
-            ))
+            ]
+            for cookie_code, cookie_name, beginning_qty, completion_qty, demand_qty, ending_qty
+            in zip(sorted_cookies, cookie_name_list, beginning, completion_qtys, demand_qtys, inventory)
+        ])
     
     logger.info(f"計算完成：共 {len(detail_rows)} 筆明細記錄")
     return detail_rows
 
 
-def write_worksheet_data(
-    sheets_helper: GoogleSheetsHelper,
-    worksheet_name: str,
-    headers: List[str],
-    rows: List[List[Any]]
-) -> None:
-    """將資料寫入指定的工作表
+def _snapshot_cache_path(spreadsheet_id: str, today: date) -> str:
+    """取得工作表快照的快取檔案路徑：<SNAPSHOT_CACHE_DIR>/<日期>/<試算表與讀取範圍的雜湊>.json
+    （讀取範圍與呈現方式也納入雜湊，INPUT_WORKSHEETS 調整後不會誤用舊快照）"""
+    key = json.dumps([spreadsheet_id, INPUT_WORKSHEETS, INPUT_VALUE_RENDER_OPTION], ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_CACHE_DIR, today.strftime('%Y%m%d'), f'{digest}.json')
+
+def read_input_worksheets(sheets_helper: GoogleSheetsHelper, today: date, use_cache: bool = False) -> Dict[str, List[List[Any]]]:
+    """讀取計算所需的所有工作表
+    說明：
+    - 預設直接以單一 batchGet 請求從 Google Sheets 讀取
+    - use_cache=True 時，當天已有快照則直接讀取本機檔案；沒有則讀取 Google Sheets 後寫入快照
+    - 快照以日期分目錄，日期變更即失效，並會刪除其他日期的舊快照
+    - 注意：當天手動修改「實盤庫存」等工作表後，請不要使用快取重新計算
+    Args: sheets_helper: Google Sheets 輔助物件, today: 今天的日期, use_cache: 是否使用當天的本機快照
+    Returns: 字典：{工作表名稱: 二維列表}"""
+    cache_path = _snapshot_cache_path(sheets_helper.spreadsheet.id, today) if use_cache else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                sheets_data = json.load(f)
+            logger.info(f"使用當天的工作表快照：{cache_path}")
+            return sheets_data
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取工作表快照失敗，改為從 Google Sheets 讀取: {e}")
     
-    Args:
-        sheets_helper: Google Sheets 輔助物件
-        worksheet_name: 工作表名稱
-        headers: 標題行
-        rows: 資料行列表
-    """
-    worksheet = sheets_helper.get_worksheet(worksheet_name, create_if_not_exists=True)
-    if worksheet is None:
-        raise ValueError(f"無法取得或建立「{worksheet_name}」工作表")
+    # 以單一 batchGet 請求讀取所有需要的工作表
+    logger.info(f"批次讀取工作表：{', '.join(INPUT_WORKSHEETS)}...")
+    sheets_data = sheets_helper.read_worksheets_batch(INPUT_WORKSHEETS, INPUT_VALUE_RENDER_OPTION)
     
-    all_data = [headers] + rows
-    worksheet.clear()
-    if len(all_data) > 0:
-        num_cols = len(headers)
-        end_col = chr(ord('A') + num_cols - 1)
-        range_name = f'A1:{end_col}{len(all_data)}'
-        worksheet.update(range_name=range_name, values=all_data)
+    if cache_path:
+        try:
+            day_dir = os.path.dirname(cache_path)
+            # 移除其他日期的舊快照（只刪除本程式建立的 YYYYMMDD 日期目錄）
+            if os.path.isdir(SNAPSHOT_CACHE_DIR):
+                for name in os.listdir(SNAPSHOT_CACHE_DIR):
+                    if not SNAPSHOT_DAY_DIR_PATTERN.fullmatch(name):
+                        continue
+                    old_dir = os.path.join(SNAPSHOT_CACHE_DIR, name)
+                    if old_dir != day_dir and os.path.isdir(old_dir):
+                        shutil.rmtree(old_dir, ignore_errors=True)
+            os.makedirs(day_dir, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(sheets_data, f, ensure_ascii=False)
+            logger.info(f"已寫入工作表快照：{cache_path}")
+        except OSError as e:
+            logger.warning(f"寫入工作表快照失敗: {e}")
+    return sheets_data
 
 def write_results(
     sheets_helper: GoogleSheetsHelper,
@@ -499,15 +584,21 @@ def write_results(
     logger.info("寫入計算結果到Google Sheets...")
     
     try:
-        write_worksheet_data(sheets_helper, '庫存預估明細', INVENTORY_DETAIL_HEADERS, detail_rows)
+        # 清空與寫入合併為兩次批次請求（batchClear + batchUpdate）
+        # 標題與明細分成兩個範圍寫入，避免為了加上標題而複製整份明細列表
+        sheets_helper.batch_write(
+            {'庫存預估明細': detail_rows},
+            headers={'庫存預估明細': INVENTORY_DETAIL_HEADERS}
+        )
         logger.info(f"已寫入 {len(detail_rows)} 筆資料到「庫存預估明細」工作表")
     except Exception as e:
         logger.error(f"寫入「庫存預估明細」工作表失敗: {e}")
         raise
 
 
-def calculate_cookie_inventory():
-    """主函數：執行餅乾庫存算料計算"""
+def calculate_cookie_inventory(use_cache: bool = False):
+    """主函數：執行餅乾庫存算料計算
+    Args: use_cache: 是否使用當天的本機工作表快照（預設否，每次都從 Google Sheets 讀取最新資料）"""
     logger.info("=" * 60)
     logger.info("開始執行餅乾庫存算料計算")
     logger.info("=" * 60)
@@ -522,34 +613,38 @@ def calculate_cookie_inventory():
         logger.info(f"計算基準日期：{format_date(today)}（今天）")
         logger.info(f"計算範圍：未來 {FORECAST_DAYS} 天（從 {format_date(today)} 到 {format_date(end_date)}）")
         
+        # 讀取所有需要的工作表（單一 batchGet 請求，或當天的本機快照）
+        sheets_data = read_input_worksheets(sheets_helper, today, use_cache)
+        
         # 1. 讀取今天的期初庫存（從Google Sheets讀取「實盤庫存」工作表）
         # 注意：此工作表的資料應該已經過手動調整（可能先從ERP同步，再手動修改）
-        initial_inventory = read_initial_inventory(sheets_helper)
+        initial_inventory = read_initial_inventory(sheets_data['實盤庫存'])
         
         # 取得餅乾名稱對應表（用於輸出餅乾品名）
-        index_dict = sheets_helper.get_index_dict()
+        index_dict = sheets_helper.get_index_dict(sheets_data['Index'])
         cookie_names = index_dict.get('餅乾', {})
         
         # 2. 讀取BOM表
-        bom = read_bom(sheets_helper)
+        bom = read_bom(sheets_data['BOM'])
         
         # 3. 讀取生產排程（從今天開始之後的投料，包含今天）
-        production_schedule = read_production_schedule(sheets_helper, today)
+        production_schedule, production_codes = read_production_schedule(sheets_data['生產排程'], today)
         
         # 4. 讀取組裝排程並展開為餅乾需求
-        assembly_schedule = read_assembly_schedule(sheets_helper, bom)
+        assembly_schedule, assembly_codes = read_assembly_schedule(sheets_data['組裝計劃'], bom)
         
         # 5. 計算未來14天的庫存預估
         # 產生更新日期
         update_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         detail_rows = calculate_inventory_forecast(
-            {k: float(v) for k, v in initial_inventory.items()},
+            initial_inventory,
             production_schedule,
             assembly_schedule,
             today,
             cookie_names,
-            update_date
+            update_date,
+            production_codes | assembly_codes
         )
         
         # 6. 輸出結果
@@ -565,9 +660,7 @@ def calculate_cookie_inventory():
         return True
         
     except Exception as e:
-        logger.error(f"計算失敗: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"計算失敗: {str(e)}")
         return False
 
 if __name__ == '__main__':
@@ -582,7 +675,7 @@ if __name__ == '__main__':
     1. 執行 sync_production_schedule.py 計算並更新生產排程的「生產片數」
     2. 執行 sync_inventory_from_erp.py 從ERP同步「帳上庫存」（可選）
     3. 手動調整 Google Sheets 中的「實盤庫存」工作表的資料
-    4. 執行此程式進行計算    
+    4. 執行此程式進行計算（加上 --cache 參數時，同一天重複執行會使用本機工作表快照）    
     計算邏輯：
     - 期初庫存 = 從Google Sheets讀取的「實盤庫存」（已手動調整）
     - 生產排程：直接讀取「生產片數」欄位（不需要重新計算）
@@ -591,5 +684,5 @@ if __name__ == '__main__':
     """
     import sys
     # 正常執行模式
-    success = calculate_cookie_inventory()
+    success = calculate_cookie_inventory(use_cache='--cache' in sys.argv[1:])
     sys.exit(0 if success else 1)
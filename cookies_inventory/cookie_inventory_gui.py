@@ -2,29 +2,76 @@
 使用 tkinter 和 ttk 建立簡單易用的圖形介面"""
 import tkinter as tk
 from tkinter import ttk, messagebox
-import threading
 import logging
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import sys
 from datetime import datetime
 
 # 導入功能模組（從套件 __init__.py 導入）
 from . import sync_index_from_erp,sync_cookie_inventory,sync_wip_inventory,sync_production_schedule,sync_receipt_data,calculate_cookie_inventory
 
+logger = logging.getLogger(__name__)
+
+# 功能按鈕定義：(按鈕文字, 任務名稱, 執行函數, 參數)
+TASKS = [
+    ("1. 同步 Index 資料", "同步 Index 資料", sync_index_from_erp, {}),
+    ("2. 同步帳上庫存", "同步帳上庫存資料", sync_cookie_inventory, {}),
+    ("3. 同步在製品庫存", "同步在製品庫存", sync_wip_inventory, {}),
+    ("4. 同步生產排程", "同步生產排程", sync_production_schedule, {}),
+    ("5. 同步完工入庫", "同步完工入庫資料", sync_receipt_data, {'days_back': 5}),
+    ("6. 計算庫存預估", "計算庫存預估", calculate_cookie_inventory, {}),
+]
+
 class TextHandler(logging.Handler):
-    """自訂日誌處理器，將日誌輸出到 Text widget"""
+    """自訂日誌處理器，將日誌輸出到 Text widget（記錄先排入佇列，每 FLUSH_INTERVAL_MS 毫秒整批格式化並寫入一次）
+    輸出格式與 '%(asctime)s - %(levelname)s - %(message)s' 相同；格式化延後到主執行緒寫入時才進行，
+    同一秒內的多筆記錄共用一次 localtime/strftime 結果"""
+    FLUSH_INTERVAL_MS = 50
+    # Text widget 最多保留的行數，避免長時間執行時記憶體持續增加
+    MAX_LINES = 5000
     def __init__(self, text_widget):
         super().__init__()
-        self.text_widget = text_widget        
+        self.text_widget = text_widget
+        self._queue = deque()
+        self._flush_scheduled = False
+        self._last_second = None
+        self._last_asctime = ''
     def emit(self, record):
         try:
-            msg = self.format(record)
-            # 使用 after 確保線程安全
-            self.text_widget.after(0, self._append_text, msg)
+            self._queue.append(record)
+            # 使用 after 確保線程安全；已排定寫入時不重複排程，大量日誌不會塞滿 Tk 事件佇列
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                self.text_widget.after(self.FLUSH_INTERVAL_MS, self._flush)
         except Exception:
             pass    
-    def _append_text(self, msg):
-        """在 Text widget 中追加文字"""
-        self.text_widget.insert(tk.END, msg + '\n')
+    def _format_record(self, record):
+        """格式化單筆記錄（asctime 以秒為單位快取）"""
+        second = int(record.created)
+        if second != self._last_second:
+            self._last_second = second
+            self._last_asctime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+        msg = f"{self._last_asctime},{int(record.msecs):03d} - {record.levelname} - {record.getMessage()}"
+        if record.exc_info:
+            msg += '\n' + ''.join(traceback.format_exception(*record.exc_info)).rstrip('\n')
+        return msg
+    def _flush(self):
+        """將佇列中的記錄一次格式化並追加到 Text widget"""
+        self._flush_scheduled = False
+        msgs = []
+        while self._queue:
+            record = self._queue.popleft()
+            try:
+                msgs.append(self._format_record(record))
+            except Exception:
+                continue
+        if not msgs:
+            return
+        self.text_widget.insert(tk.END, '\n'.join(msgs) + '\n')
+        self.text_widget.delete('1.0', f'end-{self.MAX_LINES}l')
         self.text_widget.see(tk.END)
 
 class CookieInventoryGUI:
@@ -36,6 +83,9 @@ class CookieInventoryGUI:
         self.root.resizable(True, True)        
         # 執行狀態
         self.is_running = False        
+        # 背景任務執行緒池（同一時間只執行一個任務，重複使用同一條執行緒）
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='task')
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
         # 建立介面
         self._create_widgets()        
         # 設定日誌
@@ -58,59 +108,17 @@ class CookieInventoryGUI:
         button_frame.grid(row=1, column=0, sticky="nsew", padx=(0, 10))        
         # 按鈕樣式
         button_width = 20        
-        # 同步 Index 按鈕
-        self.btn_sync_index = ttk.Button(
-            button_frame,
-            text="1. 同步 Index 資料",
-            command=self._sync_index,
-            width=button_width
-        )
-        self.btn_sync_index.grid(row=0, column=0, pady=5, sticky="ew")
-        
-        # 同步帳上庫存按鈕
-        self.btn_sync_inventory = ttk.Button(
-            button_frame,
-            text="2. 同步帳上庫存",
-            command=self._sync_inventory,
-            width=button_width
-        )
-        self.btn_sync_inventory.grid(row=1, column=0, pady=5, sticky="ew")
-        
-        # 同步在製品按鈕
-        self.btn_sync_wip = ttk.Button(
-            button_frame,
-            text="3. 同步在製品庫存",
-            command=self._sync_wip,
-            width=button_width
-        )
-        self.btn_sync_wip.grid(row=2, column=0, pady=5, sticky="ew")
-        
-        # 同步生產排程按鈕
-        self.btn_sync_production = ttk.Button(
-            button_frame,
-            text="4. 同步生產排程",
-            command=self._sync_production,
-            width=button_width
-        )
-        self.btn_sync_production.grid(row=3, column=0, pady=5, sticky="ew")
-        
-        # 同步完工入庫按鈕
-        self.btn_sync_receipt = ttk.Button(
-            button_frame,
-            text="5. 同步完工入庫",
-            command=self._sync_receipt,
-            width=button_width
-        )
-        self.btn_sync_receipt.grid(row=4, column=0, pady=5, sticky="ew")
-        
-        # 計算庫存按鈕
-        self.btn_calculate = ttk.Button(
-            button_frame,
-            text="6. 計算庫存預估",
-            command=self._calculate_inventory,
-            width=button_width
-        )
-        self.btn_calculate.grid(row=5, column=0, pady=5, sticky="ew")
+        # 功能按鈕（依 TASKS 定義建立）
+        self.task_buttons = []
+        for row, task in enumerate(TASKS):
+            button = ttk.Button(
+                button_frame,
+                text=task[0],
+                command=lambda task=task: self._run_task(*task[1:]),
+                width=button_width
+            )
+            button.grid(row=row, column=0, pady=5, sticky="ew")
+            self.task_buttons.append(button)
         
         # 清除日誌按鈕
         self.btn_clear = ttk.Button(
@@ -119,7 +127,7 @@ class CookieInventoryGUI:
             command=self._clear_log,
             width=button_width
         )
-        self.btn_clear.grid(row=6, column=0, pady=5, sticky="ew")
+        self.btn_clear.grid(row=len(TASKS), column=0, pady=5, sticky="ew")
         
         # 日誌顯示框架
         log_frame = ttk.LabelFrame(main_frame, text="執行日誌", padding="10")
@@ -163,17 +171,13 @@ class CookieInventoryGUI:
         root_logger = logging.getLogger()
         for handler in root_logger.handlers[:]:
             root_logger.removeHandler(handler)        
-        # 設定日誌格式
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')        
-        # 建立 Text widget handler
+        # 建立 Text widget handler（日誌格式由 TextHandler 自行組合）
         text_handler = TextHandler(self.log_text)
         text_handler.setLevel(logging.INFO)
-        text_handler.setFormatter(formatter)        
         # 設定根日誌記錄器
         root_logger.setLevel(logging.INFO)
         root_logger.addHandler(text_handler)        
         # 記錄啟動訊息
-        logger = logging.getLogger(__name__)
         logger.info("=" * 60)
         logger.info("餅乾庫存算料系統已啟動")
         logger.info(f"啟動時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -187,197 +191,63 @@ class CookieInventoryGUI:
     def _set_buttons_state(self, enabled):
         """設定按鈕狀態"""
         state = tk.NORMAL if enabled else tk.DISABLED
-        self.btn_sync_index.config(state=state)
-        self.btn_sync_inventory.config(state=state)
-        self.btn_sync_wip.config(state=state)
-        self.btn_sync_production.config(state=state)
-        self.btn_sync_receipt.config(state=state)
-        self.btn_calculate.config(state=state)
+        for button in self.task_buttons:
+            button.config(state=state)
         self.is_running = not enabled
         
-    def _sync_index(self):
-        """同步 Index 資料"""
-        if self.is_running:
-            messagebox.showwarning("警告", "已有任務正在執行中，請稍候...")
-            return            
-        self._set_buttons_state(False)
-        self._update_status("正在同步 Index 資料...")        
-        def run():
-            try:
-                logger = logging.getLogger(__name__)
-                logger.info("開始執行：同步 Index 資料")
-                success = sync_index_from_erp()
-                if success:
-                    logger.info("✓ 同步 Index 資料完成")
-                    self.root.after(0, lambda: messagebox.showinfo("完成", "同步 Index 資料完成！"))
-                else:
-                    logger.error("✗ 同步 Index 資料失敗")
-                    self.root.after(0, lambda: messagebox.showerror("錯誤", "同步 Index 資料失敗，請查看日誌"))
-            except Exception as e:
-                logger = logging.getLogger(__name__)
-                logger.error(f"執行錯誤: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                self.root.after(0, lambda: messagebox.showerror("錯誤", f"執行錯誤: {str(e)}"))
-            finally:
-                self.root.after(0, self._set_buttons_state, True)
-                self.root.after(0, lambda: self._update_status("就緒"))        
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
+    def _run_task(self, label, task_func, kwargs):
+        """在背景執行緒執行任務，完成後顯示結果並恢復按鈕
         
-    def _sync_inventory(self):
-        """同步帳上庫存資料"""
+        Args:
+            label: 任務名稱（用於狀態列、日誌與訊息框）
+            task_func: 執行函數，返回是否成功
+            kwargs: 執行函數的參數
+        """
         if self.is_running:
             messagebox.showwarning("警告", "已有任務正在執行中，請稍候...")
             return            
         self._set_buttons_state(False)
-        self._update_status("正在同步帳上庫存資料...")        
+        self._update_status(f"正在{label}...")        
         def run():
             try:
-                logger = logging.getLogger(__name__)
-                logger.info("開始執行：同步帳上庫存資料")
-                success = sync_cookie_inventory()
+                logger.info(f"開始執行：{label}")
+                success = task_func(**kwargs)
                 if success:
-                    logger.info("✓ 同步帳上庫存資料完成")
-                    self.root.after(0, lambda: messagebox.showinfo("完成", "同步帳上庫存資料完成！"))
+                    logger.info(f"✓ {label}完成")
+                    self.root.after(0, lambda: messagebox.showinfo("完成", f"{label}完成！"))
                 else:
-                    logger.error("✗ 同步帳上庫存資料失敗")
-                    self.root.after(0, lambda: messagebox.showerror("錯誤", "同步帳上庫存資料失敗，請查看日誌"))
+                    logger.error(f"✗ {label}失敗")
+                    self.root.after(0, lambda: messagebox.showerror("錯誤", f"{label}失敗，請查看日誌"))
             except Exception as e:
-                logger = logging.getLogger(__name__)
-                logger.error(f"執行錯誤: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                self.root.after(0, lambda: messagebox.showerror("錯誤", f"執行錯誤: {str(e)}"))
-            finally:
-                self.root.after(0, self._set_buttons_state, True)
-                self.root.after(0, lambda: self._update_status("就緒"))        
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
+                # except 區塊結束後 e 會被刪除，先取出訊息供稍後執行的 lambda 使用
+                error_message = str(e)
+                # 例外資訊隨同一筆記錄傳遞，由 TextHandler._format_record 附加 traceback
+                logger.exception("執行錯誤: %s", error_message)
+                self.root.after(0, lambda: messagebox.showerror("錯誤", f"執行錯誤: {error_message}"))
+        future = self._executor.submit(run)
+        future.add_done_callback(self._on_task_done)
         
-    def _sync_wip(self):
-        """同步在製品庫存"""
-        if self.is_running:
-            messagebox.showwarning("警告", "已有任務正在執行中，請稍候...")
-            return            
-        self._set_buttons_state(False)
-        self._update_status("正在同步在製品庫存...")        
-        def run():
-            try:
-                logger = logging.getLogger(__name__)
-                logger.info("開始執行：同步在製品庫存")
-                success = sync_wip_inventory()
-                if success:
-                    logger.info("✓ 同步在製品庫存完成")
-                    self.root.after(0, lambda: messagebox.showinfo("完成", "同步在製品庫存完成！"))
-                else:
-                    logger.error("✗ 同步在製品庫存失敗")
-                    self.root.after(0, lambda: messagebox.showerror("錯誤", "同步在製品庫存失敗，請查看日誌"))
-            except Exception as e:
-                logger = logging.getLogger(__name__)
-                logger.error(f"執行錯誤: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                self.root.after(0, lambda: messagebox.showerror("錯誤", f"執行錯誤: {str(e)}"))
-            finally:
-                self.root.after(0, self._set_buttons_state, True)
-                self.root.after(0, lambda: self._update_status("就緒"))        
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
+    def _on_task_done(self, future):
+        """任務結束（於背景執行緒呼叫）：回到主執行緒恢復按鈕與狀態列"""
+        try:
+            self.root.after(0, self._finish_task)
+        except (RuntimeError, tk.TclError):
+            # 視窗已關閉
+            pass
         
-    def _sync_production(self):
-        """同步生產排程"""
-        if self.is_running:
-            messagebox.showwarning("警告", "已有任務正在執行中，請稍候...")
-            return            
-        self._set_buttons_state(False)
-        self._update_status("正在同步生產排程...")        
-        def run():
-            try:
-                logger = logging.getLogger(__name__)
-                logger.info("開始執行：同步生產排程")
-                success = sync_production_schedule()
-                if success:
-                    logger.info("✓ 同步生產排程完成")
-                    self.root.after(0, lambda: messagebox.showinfo("完成", "同步生產排程完成！"))
-                else:
-                    logger.error("✗ 同步生產排程失敗")
-                    self.root.after(0, lambda: messagebox.showerror("錯誤", "同步生產排程失敗，請查看日誌"))
-            except Exception as e:
-                logger = logging.getLogger(__name__)
-                logger.error(f"執行錯誤: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                self.root.after(0, lambda: messagebox.showerror("錯誤", f"執行錯誤: {str(e)}"))
-            finally:
-                self.root.after(0, self._set_buttons_state, True)
-                self.root.after(0, lambda: self._update_status("就緒"))        
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
+    def _finish_task(self):
+        """恢復按鈕與狀態列"""
+        self._set_buttons_state(True)
+        self._update_status("就緒")
         
-    def _sync_receipt(self):
-        """同步完工入庫資料"""
-        if self.is_running:
-            messagebox.showwarning("警告", "已有任務正在執行中，請稍候...")
-            return            
-        self._set_buttons_state(False)
-        self._update_status("正在同步完工入庫資料...")        
-        def run():
-            try:
-                logger = logging.getLogger(__name__)
-                logger.info("開始執行：同步完工入庫資料")
-                success = sync_receipt_data(days_back=5)
-                if success:
-                    logger.info("✓ 同步完工入庫資料完成")
-                    self.root.after(0, lambda: messagebox.showinfo("完成", "同步完工入庫資料完成！"))
-                else:
-                    logger.error("✗ 同步完工入庫資料失敗")
-                    self.root.after(0, lambda: messagebox.showerror("錯誤", "同步完工入庫資料失敗，請查看日誌"))
-            except Exception as e:
-                logger = logging.getLogger(__name__)
-                logger.error(f"執行錯誤: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                self.root.after(0, lambda: messagebox.showerror("錯誤", f"執行錯誤: {str(e)}"))
-            finally:
-                self.root.after(0, self._set_buttons_state, True)
-                self.root.after(0, lambda: self._update_status("就緒"))        
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
+    def _on_close(self):
+        """關閉視窗：不再接受新任務並關閉主視窗（執行中的任務會完成後才結束程式）"""
+        self._executor.shutdown(wait=False)
+        self.root.destroy()
         
-    def _calculate_inventory(self):
-        """計算庫存預估"""
-        if self.is_running:
-            messagebox.showwarning("警告", "已有任務正在執行中，請稍候...")
-            return            
-        self._set_buttons_state(False)
-        self._update_status("正在計算庫存預估...")        
-        def run():
-            try:
-                logger = logging.getLogger(__name__)
-                logger.info("開始執行：計算庫存預估")
-                success = calculate_cookie_inventory()
-                if success:
-                    logger.info("✓ 計算庫存預估完成")
-                    self.root.after(0, lambda: messagebox.showinfo("完成", "計算庫存預估完成！"))
-                else:
-                    logger.error("✗ 計算庫存預估失敗")
-                    self.root.after(0, lambda: messagebox.showerror("錯誤", "計算庫存預估失敗，請查看日誌"))
-            except Exception as e:
-                logger = logging.getLogger(__name__)
-                logger.error(f"執行錯誤: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                self.root.after(0, lambda: messagebox.showerror("錯誤", f"執行錯誤: {str(e)}"))
-            finally:
-                self.root.after(0, self._set_buttons_state, True)
-                self.root.after(0, lambda: self._update_status("就緒"))        
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()        
     def _clear_log(self):
         """清除日誌"""
         self.log_text.delete(1.0, tk.END)
-        logger = logging.getLogger(__name__)
         logger.info("日誌已清除")
 
 def main():
@@ -3,6 +3,7 @@ ERP 資料庫連接工具模組
 專用於 MS-SQL Server 資料庫連接，用於查詢餅乾庫存
 """
 import configparser
+import threading
 from typing import List, Dict, Any, Optional
 import logging
 
@@ -11,6 +12,9 @@ try:
 except ImportError:
     raise ImportError("請安裝 pyodbc: pip install pyodbc")
 
+# 啟用 ODBC 驅動程式管理員的連線池（須在第一次連接前設定；pyodbc 預設即為 True，這裡明確指定）
+pyodbc.pooling = True
+
 logger = logging.getLogger(__name__)
 
 # 預設查詢（移出 config，避免在設定檔暴露 SQL）
@@ -52,10 +56,17 @@ WHERE MO.TA003 >= '20251101'
 ORDER BY MO.TA006, MO.TA001, MO.TA002
 """
 
+# get_item_info_by_codes 每個查詢語句最多帶入的代號數（SQL Server 參數上限為 2100）
+ITEM_INFO_QUERY_CHUNK_SIZE = 1000
+
 
 class ERPDBHelper:
     """ERP 資料庫連接輔助類別（MS-SQL Server）"""
     
+    # get_shared() 快取的共用實例（同一程序內的多次同步重複使用同一個連接）
+    _shared: Optional['ERPDBHelper'] = None
+    _shared_lock = threading.Lock()
+    
     def __init__(self, config_file='config.ini'):
         """
         初始化 ERP 資料庫連接
@@ -64,13 +75,65 @@ class ERPDBHelper:
             config_file: 設定檔路徑
         """
         self.config_file = config_file
+        # 設定檔只讀取一次，連接與各查詢共用
+        self._config = configparser.ConfigParser()
+        self._config.read(self.config_file, encoding='utf-8')
+        # 查詢 SQL 也只解析一次：config.ini 有自訂 SQL 則使用，否則使用內建預設查詢
+        self._cookie_sql = self._get_query_sql('cookie_inventory_query') or DEFAULT_COOKIE_INVENTORY_QUERY
+        self._wip_sql = self._get_query_sql('wip_inventory_query') or DEFAULT_WIP_INVENTORY_QUERY
         self.connection = None
+        self._is_shared = False
         self._connect()
     
+    def _get_query_sql(self, key: str) -> str:
+        """取得 config.ini [ERP_QUERIES] 中的自訂 SQL（未設定則回傳空字串）"""
+        if 'ERP_QUERIES' in self._config:
+            return self._config['ERP_QUERIES'].get(key, '').strip()
+        return ''
+    
+    @classmethod
+    def get_shared(cls, config_file='config.ini') -> 'ERPDBHelper':
+        """
+        取得共用的 ERP 資料庫連接（不必每次同步都重新建立連接與登入）
+        取出時以 SELECT 1 檢查連接狀態，失效時關閉並重新建立；
+        共用實例在 with 區塊結束時不會關閉連接
+        
+        Args:
+            config_file: 設定檔路徑
+            
+        Returns:
+            共用的 ERPDBHelper 實例
+        """
+        with cls._shared_lock:
+            shared = cls._shared
+            if shared is not None and shared.config_file == config_file and shared.is_alive():
+                return shared
+            if shared is not None:
+                logger.warning("共用資料庫連接已失效或設定檔不同，重新建立連接")
+                shared._is_shared = False
+                shared.close()
+            shared = cls(config_file)
+            shared._is_shared = True
+            cls._shared = shared
+            return shared
+    
+    def is_alive(self) -> bool:
+        """以 SELECT 1 檢查連接是否仍可使用"""
+        if self.connection is None:
+            return False
+        try:
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute("SELECT 1").fetchone()
+            finally:
+                cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+    
     def _connect(self):
         """建立 MS-SQL Server 資料庫連接"""
-        config = configparser.ConfigParser()
-        config.read(self.config_file, encoding='utf-8')
+        config = self._config
         
         if 'ERP_DATABASE' not in config:
             raise ValueError("config.ini 中缺少 [ERP_DATABASE] 區段")
@@ -153,13 +216,8 @@ class ERPDBHelper:
             # 取得欄位名稱
             columns = [desc[0] for desc in cursor.description] if cursor.description else []
             
-            # 轉換為字典列表
-            results = []
-            for row in cursor.fetchall():
-                row_dict = {col: row[i] for i, col in enumerate(columns)}
-                results.append(row_dict)
-            
-            return results
+            # 轉換為字典列表（以 zip 在 C 層配對欄位名稱與值）
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
         finally:
             cursor.close()
     
@@ -173,33 +231,24 @@ class ERPDBHelper:
                     'unit': '片',
                     'cookie_name': '餅乾品名'},...
             ]"""
-        config = configparser.ConfigParser()
-        config.read(self.config_file, encoding='utf-8')
-        
-        cookie_sql = ''
-        if 'ERP_QUERIES' in config:
-            cookie_sql = config['ERP_QUERIES'].get('cookie_inventory_query', '').strip()
-        
-        if cookie_sql:
-            logger.info("執行餅乾庫存查詢（使用 config.ini 自訂 SQL）")
-        else:
+        if self._cookie_sql is DEFAULT_COOKIE_INVENTORY_QUERY:
             logger.info("執行餅乾庫存查詢（使用內建預設 SQL）")
-            cookie_sql = DEFAULT_COOKIE_INVENTORY_QUERY
+        else:
+            logger.info("執行餅乾庫存查詢（使用 config.ini 自訂 SQL）")
         
-        results = self.execute_query(cookie_sql)
+        results = self.execute_query(self._cookie_sql)
         
         # 標準化欄位名稱
-        standardized = []
-        for row in results:
-            standardized.append({
+        return [
+            {
                 'cookie_code': str(row.get('cookie_code', '')).strip(),
                 'qty': row.get('qty', 0),
                 'warehouse_code': str(row.get('warehouse_code', '')).strip(),
                 'unit': str(row.get('unit', '片')).strip(),
                 'cookie_name': str(row.get('cookie_name', '')).strip()
-            })
-        
-        return standardized
+            }
+            for row in results
+        ]
     
     def get_wip_inventory(self) -> List[Dict[str, Any]]:
         """
@@ -217,34 +266,25 @@ class ERPDBHelper:
                 ...
             ]
         """
-        config = configparser.ConfigParser()
-        config.read(self.config_file, encoding='utf-8')
-        
-        wip_sql = ''
-        if 'ERP_QUERIES' in config:
-            wip_sql = config['ERP_QUERIES'].get('wip_inventory_query', '').strip()
-        
-        if wip_sql:
-            logger.info("執行在製品庫存查詢（使用 config.ini 自訂 SQL）")
-        else:
+        if self._wip_sql is DEFAULT_WIP_INVENTORY_QUERY:
             logger.info("執行在製品庫存查詢（使用內建預設 SQL）")
-            wip_sql = DEFAULT_WIP_INVENTORY_QUERY
+        else:
+            logger.info("執行在製品庫存查詢（使用 config.ini 自訂 SQL）")
         
-        results = self.execute_query(wip_sql)
+        results = self.execute_query(self._wip_sql)
         
         # 標準化欄位名稱
-        standardized = []
-        for row in results:
-            standardized.append({
+        return [
+            {
                 'mo_number_type': str(row.get('mo_number_type', '')).strip(),
                 'mo_number': str(row.get('mo_number', '')).strip(),
                 'cookie_code': str(row.get('cookie_code', '')).strip(),
                 'wip_qty': row.get('wip_qty', 0),
                 'unit': str(row.get('unit', '片')).strip(),
                 'cookie_name': str(row.get('cookie_name', '')).strip()
-            })
-        
-        return standardized
+            }
+            for row in results
+        ]
     
     def get_item_info_by_codes(self, codes: List[str]) -> Dict[str, Dict[str, Any]]:
         """
@@ -259,22 +299,24 @@ class ERPDBHelper:
         if not codes:
             return {}
         
-        # 建立 SQL IN 子句（使用安全的字串轉義）
-        # 注意：這裡的代號都是內部系統代號，相對安全
-        safe_codes = [code.replace("'", "''") for code in codes]  # SQL 注入防護
-        codes_str = "','".join(safe_codes)
-        sql = f"""
-            SELECT 
-                MB001 as code,
-                COALESCE(MB002, '') as cookie_name,
-                COALESCE(MB104, 0) as raw_weight,
-                COALESCE(MB105, 0) as cooked_weight
-            FROM [AS_online].[dbo].[INVMB]
-            WHERE MB001 IN ('{codes_str}')
-        """
-        
-        logger.info(f"查詢 {len(codes)} 個代號的品名、生重、熟重資訊...")
-        results = self.execute_query(sql)
+        # 去除重複代號，並以參數綁定的 IN 子句分批查詢
+        # （SQL Server 單一語句最多 2100 個參數，每批 ITEM_INFO_QUERY_CHUNK_SIZE 個代號）
+        unique_codes = list(dict.fromkeys(codes))
+        logger.info(f"查詢 {len(unique_codes)} 個代號的品名、生重、熟重資訊...")
+        results = []
+        for start in range(0, len(unique_codes), ITEM_INFO_QUERY_CHUNK_SIZE):
+            chunk = unique_codes[start:start + ITEM_INFO_QUERY_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            sql = f"""
+                SELECT 
+                    MB001 as code,
+                    COALESCE(MB002, '') as cookie_name,
+                    COALESCE(MB104, 0) as raw_weight,
+                    COALESCE(MB105, 0) as cooked_weight
+                FROM [AS_online].[dbo].[INVMB]
+                WHERE MB001 IN ({placeholders})
+            """
+            results.extend(self.execute_query(sql, tuple(chunk)))
         
         # 轉換為字典格式
         info_dict = {}
@@ -294,6 +336,9 @@ class ERPDBHelper:
         """
         查詢入庫單表頭和單身資料（合併查詢）
         
+        同一入庫日期、同一餅乾代號的多筆入庫在 SQL 端以 GROUP BY 合併，
+        驗收數量加總，品名/規格/單位取 MAX
+        
         查詢條件：
         - TF003（入庫日期）在從今天到（今天-{days_back}天）這段期間
         - TF011='P104'
@@ -313,10 +358,8 @@ class ERPDBHelper:
                     'cookie_name': 'TG005',
                     'spec': 'TG006',
                     'unit': 'TG007',
-                    'receipt_qty': 'TG013',
-                    'receipt_date': 'TF003',
-                    'receipt_type': 'TF001',
-                    'receipt_number': 'TF002'
+                    'receipt_qty': 'SUM(TG013)',
+                    'receipt_date': 'TF003'
                 },
                 ...
             ]
@@ -334,13 +377,11 @@ class ERPDBHelper:
         sql = f"""
         SELECT 
             MOCTG.TG004 as cookie_code,
-            COALESCE(MOCTG.TG005, '') as cookie_name,
-            COALESCE(MOCTG.TG006, '') as spec,
-            COALESCE(MOCTG.TG007, '') as unit,
-            MOCTG.TG013 as receipt_qty,
-            MOCTF.TF003 as receipt_date,
-            MOCTF.TF001 as receipt_type,
-            MOCTF.TF002 as receipt_number
+            MAX(COALESCE(MOCTG.TG005, '')) as cookie_name,
+            MAX(COALESCE(MOCTG.TG006, '')) as spec,
+            MAX(COALESCE(MOCTG.TG007, '')) as unit,
+            SUM(MOCTG.TG013) as receipt_qty,
+            MOCTF.TF003 as receipt_date
         FROM [AS_online].[dbo].[MOCTF] MOCTF
         INNER JOIN [AS_online].[dbo].[MOCTG] MOCTG
             ON MOCTF.TF001 = MOCTG.TG001
@@ -349,7 +390,8 @@ class ERPDBHelper:
             AND MOCTF.TF003 <= '{today_str}'
             AND MOCTF.TF011 = 'P104'
             AND MOCTF.TF001 IN ('5801', '5802')
-        ORDER BY MOCTF.TF003 DESC, MOCTF.TF001, MOCTF.TF002, MOCTG.TG004
+        GROUP BY MOCTF.TF003, MOCTG.TG004
+        ORDER BY MOCTF.TF003 DESC, MOCTG.TG004
         """
         
         logger.info(f"查詢入庫單資料（日期範圍：{start_date_str} 到 {today_str}，TF011='P104'，TF001 IN ('5801', '5802')）...")
@@ -364,9 +406,7 @@ class ERPDBHelper:
                 'spec': str(row.get('spec', '')).strip(),
                 'unit': str(row.get('unit', '')).strip(),
                 'receipt_qty': float(row.get('receipt_qty', 0)) if row.get('receipt_qty') else 0.0,
-                'receipt_date': str(row.get('receipt_date', '')).strip(),
-                'receipt_type': str(row.get('receipt_type', '')).strip(),
-                'receipt_number': str(row.get('receipt_number', '')).strip()
+                'receipt_date': str(row.get('receipt_date', '')).strip()
             })
         
         logger.info(f"成功查詢到 {len(standardized)} 筆入庫單資料")
@@ -383,5 +423,6 @@ class ERPDBHelper:
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """支援 with 語句"""
-        self.close()
+        """支援 with 語句（共用實例不關閉連接，留給下一次使用）"""
+        if not self._is_shared:
+            self.close()
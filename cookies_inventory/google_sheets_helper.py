@@ -5,8 +5,20 @@ Google Sheets 操作工具模組
 import configparser
 import json
 import gspread
+from gspread.utils import fill_gaps
 from google.oauth2.service_account import Credentials
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Union
+
+# Index 工作表「類型」欄位值對應到標準鍵值
+INDEX_TYPE_MAPPING = {
+    '餅乾': '餅乾',
+    '禮盒': '禮盒',
+    '產線': '產線',
+    'Cookie': '餅乾',
+    'Box': '禮盒',
+    'Line': '產線',
+    'LINE': '產線'
+}
 
 
 class GoogleSheetsHelper:
@@ -99,12 +111,15 @@ class GoogleSheetsHelper:
         
         return self.spreadsheet.add_worksheet(title=worksheet_name, rows=rows, cols=cols)
     
-    def read_worksheet(self, worksheet_name: str) -> List[List[Any]]:
+    def read_worksheet(self, worksheet_name: str, value_render_option: Optional[str] = None,
+                       columns: Optional[str] = None) -> List[List[Any]]:
         """
         讀取整個工作表的資料
         
         Args:
             worksheet_name: 工作表名稱
+            value_render_option: 值的呈現方式（可選，例如 'UNFORMATTED_VALUE'；預設為顯示格式的字串）
+            columns: 只讀取的欄位範圍（可選，例如 'A:D'；None 表示整個工作表）
             
         Returns:
             二維列表，每一行是一個列表
@@ -112,8 +127,53 @@ class GoogleSheetsHelper:
         worksheet = self.get_worksheet(worksheet_name)
         if worksheet is None:
             return []
+        if columns:
+            return fill_gaps(worksheet.get(columns, value_render_option=value_render_option))
+        if value_render_option:
+            return worksheet.get_all_values(value_render_option=value_render_option)
         return worksheet.get_all_values()
     
+    def read_worksheets_batch(
+        self,
+        worksheets: Union[List[str], Dict[str, Optional[str]]],
+        value_render_option: Optional[str] = None
+    ) -> Dict[str, List[List[Any]]]:
+        """
+        以單一 values.batchGet API 請求讀取多個工作表的資料
+        
+        Args:
+            worksheets: 工作表名稱列表，或 {工作表名稱: 欄位範圍（例如 'A:D'，None 表示整個工作表）}，
+                        只讀取需要的欄位可減少回傳的資料量
+            value_render_option: 值的呈現方式（可選）；'UNFORMATTED_VALUE' 時數字直接以 int/float 回傳、
+                                 日期以序列值（1899/12/30 起算的天數）回傳，省去字串解析
+            
+        Returns:
+            字典：{工作表名稱: 二維列表}；若批次讀取失敗（例如工作表不存在），改為逐一讀取各工作表的欄位範圍
+        """
+        if not isinstance(worksheets, dict):
+            worksheets = dict.fromkeys(worksheets)
+        worksheet_names = list(worksheets)
+        ranges = [
+            f"'{name}'!{columns}" if columns else f"'{name}'"
+            for name, columns in worksheets.items()
+        ]
+        try:
+            params = {'valueRenderOption': value_render_option} if value_render_option else None
+            response = self.spreadsheet.values_batch_get(ranges, params=params)
+        except gspread.exceptions.APIError:
+            # 批次讀取失敗時改為依序逐一讀取（gspread client 與其 HTTP session 不保證執行緒安全），
+            # 仍只讀取呼叫端指定的欄位範圍
+            return {
+                name: self.read_worksheet(name, value_render_option, columns)
+                for name, columns in worksheets.items()
+            }
+        
+        value_ranges = response.get('valueRanges', [])
+        return {
+            name: fill_gaps(value_range.get('values', []))
+            for name, value_range in zip(worksheet_names, value_ranges)
+        }
+    
     def write_worksheet(self, worksheet_name: str, data: List[List[Any]], start_cell: str = 'A1'):
         """
         寫入資料到工作表
@@ -126,6 +186,49 @@ class GoogleSheetsHelper:
         worksheet = self.get_worksheet(worksheet_name, create_if_not_exists=True)
         worksheet.update(range_name=start_cell, values=data)
     
+    def batch_write(self, sheets_data: Dict[str, List[List[Any]]], headers: Optional[Dict[str, List[Any]]] = None,
+                    chunk_rows: int = 10000):
+        """
+        清空並覆寫多個工作表：以一次 values.batchClear 與分段的 values.batchUpdate 完成
+        
+        Args:
+            sheets_data: 字典：{工作表名稱: 二維列表資料}，資料從 A1 開始寫入（RAW）
+            headers: 字典：{工作表名稱: 標題行}（可選）；有標題行的工作表，標題寫入 A1、資料從 A2 開始，
+                     呼叫端不必為了加上標題而複製整份資料列表
+            chunk_rows: 每次 values.batchUpdate 最多寫入的資料列數；資料量小時仍只送出一次請求，
+                        資料量大時分段送出，避免單一請求的 JSON 過大
+        """
+        headers = headers or {}
+        if not sheets_data:
+            return
+        
+        # 不存在的工作表先建立（只取一次工作表清單）
+        existing_titles = set(self.list_worksheets())
+        for name in sheets_data:
+            if name not in existing_titles:
+                self.spreadsheet.add_worksheet(title=name, rows=1000, cols=26)
+        
+        self.spreadsheet.values_batch_clear(body={'ranges': [f"'{name}'" for name in sheets_data]})
+        
+        # 依 chunk_rows 將資料切成多個範圍，再累積成每批不超過 chunk_rows 列資料的請求（標題行不計）
+        data = []
+        pending_rows = 0
+        for name, rows in sheets_data.items():
+            header = headers.get(name)
+            if header:
+                data.append({'range': f"'{name}'!A1", 'values': [header]})
+            start_row = 2 if header else 1
+            for offset in range(0, len(rows), chunk_rows):
+                chunk = rows[offset:offset + chunk_rows]
+                if data and pending_rows + len(chunk) > chunk_rows:
+                    self.spreadsheet.values_batch_update({'valueInputOption': 'RAW', 'data': data})
+                    data = []
+                    pending_rows = 0
+                data.append({'range': f"'{name}'!A{start_row + offset}", 'values': chunk})
+                pending_rows += len(chunk)
+        if data:
+            self.spreadsheet.values_batch_update({'valueInputOption': 'RAW', 'data': data})
+    
     def append_rows(self, worksheet_name: str, rows: List[List[Any]]):
         """
         在工作表末尾新增資料列
@@ -169,10 +272,13 @@ class GoogleSheetsHelper:
         """
         return [ws.title for ws in self.spreadsheet.worksheets()]
     
-    def get_index_dict(self) -> Dict[str, Dict[str, str]]:
+    def get_index_dict(self, data: Optional[List[List[Any]]] = None) -> Dict[str, Dict[str, str]]:
         """
         讀取 Index 工作表，建立代號與名稱的對應字典
         
+        Args:
+            data: 已讀取的 Index 工作表資料（可選，未提供則重新讀取工作表）
+        
         Returns:
             字典結構: {
                 '餅乾': {'COOKIE001': '奶油餅乾', ...},
@@ -181,33 +287,25 @@ class GoogleSheetsHelper:
             }
         """
         try:
-            data = self.read_worksheet('Index')
+            if data is None:
+                data = self.read_worksheet('Index')
             if not data or len(data) < 2:
                 return {'餅乾': {}, '禮盒': {}, '產線': {}}
             
             # 第一行是標題: ['類型', '代號', '名稱', '備註']
             result = {'餅乾': {}, '禮盒': {}, '產線': {}}
+            map_type = INDEX_TYPE_MAPPING.get
             
             for row in data[1:]:  # 跳過標題行
                 if len(row) >= 3 and row[0] and row[1] and row[2]:
-                    item_type = row[0].strip()
-                    code = row[1].strip()
-                    name = row[2].strip()
-                    
-                    # 將類型映射到標準鍵值
-                    type_mapping = {
-                        '餅乾': '餅乾',
-                        '禮盒': '禮盒',
-                        '產線': '產線',
-                        'Cookie': '餅乾',
-                        'Box': '禮盒',
-                        'Line': '產線',
-                        'LINE': '產線'
-                    }
+                    item_type = str(row[0]).strip()
+                    code = str(row[1]).strip()
+                    name = str(row[2]).strip()
                     
-                    mapped_type = type_mapping.get(item_type, item_type)
-                    if mapped_type in result:
-                        result[mapped_type][code] = name
+                    # 將類型映射到標準鍵值，直接取得對應的名稱字典
+                    names = result.get(map_type(item_type, item_type))
+                    if names is not None:
+                        names[code] = name
             
             return result
         except Exception:
@@ -225,16 +323,7 @@ class GoogleSheetsHelper:
             名稱，如果找不到則返回 None
         """
         index_dict = self.get_index_dict()
-        type_mapping = {
-            '餅乾': '餅乾',
-            '禮盒': '禮盒',
-            '產線': '產線',
-            'Cookie': '餅乾',
-            'Box': '禮盒',
-            'Line': '產線',
-            'LINE': '產線'
-        }
-        mapped_type = type_mapping.get(item_type, item_type)
+        mapped_type = INDEX_TYPE_MAPPING.get(item_type, item_type)
         return index_dict.get(mapped_type, {}).get(code.strip())
 
 
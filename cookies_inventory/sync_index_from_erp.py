@@ -5,6 +5,7 @@
 - 如果 Index 工作表沒有「生重」和「熟重」欄位，會自動新增"""
 import sys
 from typing import List, Dict, Set, Any, Tuple
+from gspread.utils import rowcol_to_a1
 from .google_sheets_helper import GoogleSheetsHelper
 from .erp_db_helper import ERPDBHelper
 import logging
@@ -15,133 +16,116 @@ logger = logging.getLogger(__name__)
 # Index 工作表標準欄位定義
 INDEX_HEADERS = ['類型', '代號', '名稱', '生重', '熟重', '備註']
 
+# 讀取 Index 工作表時不套用顯示格式：數字直接為 int/float，寫回時不會變成文字
+INDEX_VALUE_RENDER_OPTION = 'UNFORMATTED_VALUE'
+
 def get_header_index(headers: List[str], header_name: str, default: int = 0) -> int:
     """取得標題欄位索引"""
     return headers.index(header_name) if header_name in headers else default
 
-def ensure_index_headers(worksheet, sheets_helper: GoogleSheetsHelper) -> List[str]:
-    """確保 Index 工作表標題行包含所有必要欄位
+def ensure_index_headers(existing_data: List[List[Any]]) -> Tuple[List[str], bool]:
+    """檢查 Index 工作表標題行是否包含所有必要欄位（不寫入工作表，標題行隨最後的整批寫入一併更新）
     
     Args:
-        worksheet: Google Sheets 工作表物件
-        sheets_helper: Google Sheets 輔助物件
+        existing_data: Index 工作表現有資料（二維列表）
     
     Returns:
-        標題行列表
+        (標準標題行列表, 是否需要更新標題行)
     """
-    existing_data = sheets_helper.read_worksheet('Index')
-    
-    if not existing_data:
-        worksheet.update(range_name='1:1', values=[INDEX_HEADERS])
-        logger.info("已建立 Index 工作表標題行")
-        return INDEX_HEADERS
-    
     existing_headers = existing_data[0] if existing_data else []
     
     if existing_headers == INDEX_HEADERS:
-        return existing_headers
+        return INDEX_HEADERS, False
     
-    worksheet.update(range_name='1:1', values=[INDEX_HEADERS])
-    logger.info(f"已更新 Index 工作表標題行順序為: {', '.join(INDEX_HEADERS)}")
-    return INDEX_HEADERS
+    if existing_headers:
+        logger.info(f"Index 工作表標題行將更新為: {', '.join(INDEX_HEADERS)}")
+    return INDEX_HEADERS, True
 
-def get_all_codes_from_index(sheets_helper: GoogleSheetsHelper) -> List[str]:
-    """從 Index 工作表取得所有代號列表
+def extract_codes(existing_data: List[List[Any]], headers: List[str]) -> List[str]:
+    """從 Index 工作表資料取得所有代號列表
     
     Args:
-        sheets_helper: Google Sheets 輔助物件
+        existing_data: Index 工作表現有資料（二維列表，第一行為標題）
+        headers: 現有資料的標題行
     
     Returns:
-        代號列表
+        不重複的代號列表
     """
-    logger.info("讀取 Index 工作表...")
-    data = sheets_helper.read_worksheet('Index')
-    if not data or len(data) < 2:
-        logger.warning("Index 工作表沒有資料")
-        return []
-    
-    headers = data[0]
     code_idx = get_header_index(headers, '代號', 1)
     
-    codes = [
+    # 以 dict.fromkeys 去除重複代號並保留原順序，ERP 查詢只帶入不重複的代號
+    codes = list(dict.fromkeys(
         str(row[code_idx]).strip()
-        for row in data[1:]
+        for row in existing_data[1:]
         if len(row) > code_idx and row[code_idx]
-    ]
+    ))
     
     logger.info(f"從 Index 工作表讀取到 {len(codes)} 個代號")
     return codes
 
-def safe_get_value(row: List[Any], header_to_idx: Dict[str, int], header_name: str, default_idx: int = 0) -> str:
-    """安全地從資料行中取得欄位值
-    
-    Args:
-        row: 資料行
-        header_to_idx: 標題到索引的對應字典
-        header_name: 欄位名稱
-        default_idx: 預設索引
-    
-    Returns:
-        欄位值（字串）
-    """
-    idx = header_to_idx.get(header_name, default_idx)
-    return str(row[idx]).strip() if idx < len(row) and row[idx] else ''
-
 def build_updated_row(
     old_row: List[Any],
-    old_header_to_idx: Dict[str, int],
-    new_header_to_idx: Dict[str, int],
+    column_perm: List[int],
+    field_idx: Tuple[int, int, int, int],
     item_info: Dict[str, Dict[str, Any]]
 ) -> Tuple[List[Any], bool]:
     """構建更新後的資料行
     
     Args:
         old_row: 舊資料行
-        old_header_to_idx: 舊標題到索引的對應
-        new_header_to_idx: 新標題到索引的對應
+        column_perm: 新標題每一欄對應到舊資料行的索引（由呼叫端預先計算一次）
+        field_idx: 新標題中（代號, 名稱, 生重, 熟重）的索引
         item_info: ERP 查詢結果
     
     Returns:
         (更新後的資料行, 是否已更新)
     """
-    # 從舊資料行中取得各欄位的值
-    old_values = {
-        header: safe_get_value(old_row, old_header_to_idx, header, idx)
-        for idx, header in enumerate(INDEX_HEADERS)
-    }
-    
-    # 按照新順序構建新行
-    new_row = [''] * len(INDEX_HEADERS)
-    for header, idx in new_header_to_idx.items():
-        new_row[idx] = old_values.get(header, '')
+    # 空白行（工作表中間的空行）直接返回空行，不逐欄轉換也不查詢 ERP 結果
+    # （以 UNFORMATTED_VALUE 讀取時 0、False 是有效的儲存格值，只有空字串才算空白）
+    if all(value == '' for value in old_row):
+        return [''] * len(column_perm), False
+    
+    # 按照新順序從舊資料行取值（文字去除前後空白；數字如生重、熟重保留原型別，寫回時仍為數字）
+    # 0、False 為有效值需保留，只有缺少的欄位、None 與空字串才填入空字串
+    row_len = len(old_row)
+    new_row = [
+        (value.strip() if type(value) is str else value)
+        if idx < row_len and (value := old_row[idx]) is not None and value != '' else ''
+        for idx in column_perm
+    ]
     
     # 如果找到代號，從 ERP 查詢結果更新名稱、生重、熟重
-    code = old_values.get('代號', '').strip()
-    if code and code in item_info:
-        info = item_info[code]
-        new_row[new_header_to_idx['名稱']] = info.get('cookie_name', '')
-        new_row[new_header_to_idx['生重']] = info['raw_weight'] if info.get('raw_weight', 0) > 0 else ''
-        new_row[new_header_to_idx['熟重']] = info['cooked_weight'] if info.get('cooked_weight', 0) > 0 else ''
+    code_idx, name_idx, raw_idx, cooked_idx = field_idx
+    info = item_info.get(str(new_row[code_idx]))
+    if info is not None:
+        new_row[name_idx] = info.get('cookie_name', '')
+        new_row[raw_idx] = info['raw_weight'] if info.get('raw_weight', 0) > 0 else ''
+        new_row[cooked_idx] = info['cooked_weight'] if info.get('cooked_weight', 0) > 0 else ''
         return new_row, True
     
     return new_row, False
 
-def write_worksheet_data(worksheet, headers: List[str], rows: List[List[Any]]) -> None:
-    """將資料寫入工作表
+def write_worksheet_data(worksheet, headers: List[str], rows: List[List[Any]], existing_row_count: int = 0) -> None:
+    """將資料寫入工作表（標題行與資料行以一次 batch_update 寫入，不另外複製合併成一份列表）
     
     Args:
         worksheet: Google Sheets 工作表物件
         headers: 標題行
         rows: 資料行列表
+        existing_row_count: 工作表原有的列數（含標題行）；多於這次寫入的列會先清除
     """
     if not rows or worksheet is None:
         return
     
-    final_data = [headers] + rows
     num_cols = len(headers)
-    end_col = chr(ord('A') + num_cols - 1)
-    range_name = f'A1:{end_col}{len(final_data)}'
-    worksheet.update(range_name=range_name, values=final_data)
+    last_row = len(rows) + 1
+    if existing_row_count > last_row:
+        worksheet.batch_clear([f'A{last_row + 1}:{rowcol_to_a1(existing_row_count, num_cols)}'])
+    # 明確指定 RAW：代號、名稱與重量直接寫入，不經 Sheets 的公式與地區格式解析
+    worksheet.batch_update([
+        {'range': f'A1:{rowcol_to_a1(1, num_cols)}', 'values': [headers]},
+        {'range': f'A2:{rowcol_to_a1(last_row, num_cols)}', 'values': rows},
+    ], value_input_option='RAW')
 
 def sync_index_from_erp() -> bool:
     """同步品名、生重、熟重到 Google Sheets 的 Index 工作表
@@ -161,12 +145,16 @@ def sync_index_from_erp() -> bool:
         # 取得 Index 工作表
         worksheet = sheets_helper.get_worksheet('Index', create_if_not_exists=True)
         
-        # 確保標題行正確
-        headers = ensure_index_headers(worksheet, sheets_helper)
+        # 讀取現有資料（只讀取一次，標題檢查與代號清單都使用這份資料）
+        logger.info("讀取 Index 工作表...")
+        existing_data = worksheet.get_all_values(value_render_option=INDEX_VALUE_RENDER_OPTION)
         
-        # 讀取現有資料
-        existing_data = sheets_helper.read_worksheet('Index')
+        # 確保標題行正確
+        headers, needs_header_write = ensure_index_headers(existing_data)
         if len(existing_data) < 2:
+            if needs_header_write:
+                worksheet.update(range_name='1:1', values=[headers])
+                logger.info("已寫入 Index 工作表標題行")
             logger.warning("Index 工作表沒有資料行")
             return False
         
@@ -174,15 +162,18 @@ def sync_index_from_erp() -> bool:
         old_headers = existing_data[0]
         old_header_to_idx = {header: idx for idx, header in enumerate(old_headers)}
         new_header_to_idx = {header: idx for idx, header in enumerate(headers)}
+        # 預先計算欄位對應：新標題每一欄在舊資料行的索引（舊標題沒有的欄位沿用標準位置）
+        column_perm = [old_header_to_idx.get(header, idx) for idx, header in enumerate(headers)]
+        field_idx = tuple(new_header_to_idx[header] for header in ('代號', '名稱', '生重', '熟重'))
         
         # 取得所有代號
-        codes = get_all_codes_from_index(sheets_helper)
+        codes = extract_codes(existing_data, old_headers)
         if not codes:
             logger.warning("Index 工作表中沒有代號")
             return False
         
         # 連接 ERP 資料庫並查詢資料
-        with ERPDBHelper() as erp_db:
+        with ERPDBHelper.get_shared() as erp_db:
             logger.info("已連接到 ERP 資料庫")
             logger.info("查詢 ERP 品名、生重、熟重資料...")
             item_info = erp_db.get_item_info_by_codes(codes)
@@ -199,16 +190,16 @@ def sync_index_from_erp() -> bool:
             
             for old_row in existing_data[1:]:
                 new_row, is_updated = build_updated_row(
-                    old_row, old_header_to_idx, new_header_to_idx, item_info
+                    old_row, column_perm, field_idx, item_info
                 )
                 updated_rows.append(new_row)
                 if is_updated:
                     updated_count += 1
-                elif new_row[new_header_to_idx['代號']].strip():
+                elif new_row[field_idx[0]]:
                     not_found_count += 1
         
-        # 批次更新所有資料
-        write_worksheet_data(worksheet, headers, updated_rows)
+        # 批次更新所有資料（標題行一併寫入）
+        write_worksheet_data(worksheet, headers, updated_rows, len(existing_data))
         
         logger.info(f"同步完成: 更新 {updated_count} 筆，未找到 {not_found_count} 筆")
         logger.info("=" * 60)
@@ -7,6 +7,7 @@
 import sys
 from datetime import datetime
 from typing import List, Dict, Set, Any
+from gspread.utils import rowcol_to_a1
 from .google_sheets_helper import GoogleSheetsHelper
 from .erp_db_helper import ERPDBHelper
 import logging
@@ -121,7 +122,7 @@ def sync_cookie_inventory() -> bool:
             logger.warning("無法進行同步：Index 工作表中沒有餅乾代號")
             return False
         # 連接 ERP 資料庫並查詢庫存
-        with ERPDBHelper() as erp_db:
+        with ERPDBHelper.get_shared() as erp_db:
             logger.info("已連接到 ERP 資料庫")
             logger.info("查詢 ERP SP40, SP50, SP60, SP80 庫存資料...")
             inventory_data = erp_db.get_cookie_inventory()
@@ -224,8 +225,7 @@ def sync_cookie_inventory() -> bool:
             if len(final_data) > 0 and worksheet is not None:
                 worksheet.clear()
                 num_cols = len(headers)
-                end_col = chr(ord('A') + num_cols - 1)
-                range_name = f'A1:{end_col}{len(final_data)}'
+                range_name = f'A1:{rowcol_to_a1(len(final_data), num_cols)}'
                 worksheet.update(range_name=range_name, values=final_data)            
             logger.info(f"同步完成: 更新 {updated_count} 筆，新增 {new_count} 筆，已排序")
             logger.info("=" * 60)
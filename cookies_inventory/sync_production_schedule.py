@@ -8,6 +8,7 @@
 import sys
 from typing import Dict, List, Any
 from datetime import datetime, timedelta
+from gspread.utils import rowcol_to_a1
 from .google_sheets_helper import GoogleSheetsHelper
 from .erp_db_helper import ERPDBHelper
 import logging
@@ -129,7 +130,7 @@ def sync_production_schedule() -> bool:
         cookie_names = {}
         if cookie_codes:
             try:
-                with ERPDBHelper() as erp_db:
+                with ERPDBHelper.get_shared() as erp_db:
                     logger.info(f"從 ERP 查詢 {len(cookie_codes)} 個餅乾代號的品名...")
                     item_info = erp_db.get_item_info_by_codes(list(cookie_codes))
                     for code, info in item_info.items():
@@ -226,8 +227,7 @@ def sync_production_schedule() -> bool:
         worksheet.clear()
         if len(updated_rows) > 0:
             num_cols = len(standard_headers)
-            end_col = chr(ord('A') + num_cols - 1)
-            range_name = f'A1:{end_col}{len(updated_rows)}'
+            range_name = f'A1:{rowcol_to_a1(len(updated_rows), num_cols)}'
             worksheet.update(range_name=range_name, values=updated_rows)
         
         logger.info(f"已成功更新 {len(updated_rows) - 1} 筆資料到生產排程工作表")
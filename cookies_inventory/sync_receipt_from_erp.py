@@ -4,7 +4,9 @@
 - 自動更新或新增完工入庫資料"""
 import sys
 from datetime import datetime
-from typing import List, Dict, Set, Any
+from operator import itemgetter
+from typing import List, Dict, Set, Any, Optional, Tuple, Callable
+from gspread.utils import rowcol_to_a1
 from .google_sheets_helper import GoogleSheetsHelper
 from .erp_db_helper import ERPDBHelper
 import logging
@@ -15,6 +17,16 @@ logger = logging.getLogger(__name__)
 # 工作表欄位定義
 RECEIPT_HEADERS = ['入庫日期', '餅乾代號', '品名', '驗收數量', '單位', '規格', '最後更新日期']
 
+# 現有工作表的欄位順序 → 轉換為新格式時，新格式各欄在現有資料行中的索引
+RECEIPT_LAYOUTS = {
+    # 新格式（7欄）
+    tuple(RECEIPT_HEADERS): (0, 1, 2, 3, 4, 5, 6),
+    # 舊格式（9欄）：入庫日期、單別、單號、餅乾代號、品名、規格、單位、驗收數量、最後更新日期
+    ('入庫日期', '單別', '單號', '餅乾代號', '品名', '規格', '單位', '驗收數量', '最後更新日期'): (0, 3, 4, 7, 6, 5, 8),
+    # 舊順序（7欄）：入庫日期、餅乾代號、品名、規格、單位、驗收數量、最後更新日期
+    ('入庫日期', '餅乾代號', '品名', '規格', '單位', '驗收數量', '最後更新日期'): (0, 1, 2, 5, 4, 3, 6),
+}
+
 def format_receipt_date(date_str: str) -> str:
     """格式化入庫日期為 YYYY/MM/DD 格式
     
@@ -26,14 +38,7 @@ def format_receipt_date(date_str: str) -> str:
     """
     if not date_str or len(date_str) != 8:
         return date_str
-    
-    try:
-        year = date_str[:4]
-        month = date_str[4:6]
-        day = date_str[6:8]
-        return f"{year}/{month}/{day}"
-    except Exception:
-        return date_str
+    return f"{date_str[:4]}/{date_str[4:6]}/{date_str[6:]}"
 
 def convert_qty_to_float(qty: Any) -> float:
     """將驗收數量轉換為 float（Google Sheets API 需要可序列化的類型）
@@ -48,6 +53,106 @@ def convert_qty_to_float(qty: Any) -> float:
         return float(qty)
     return float(qty) if qty else 0.0
 
+def normalize_existing_row(row: List[Any]) -> Optional[Tuple[Tuple[str, str], List[Any]]]:
+    """取得現有資料行的去重鍵，並轉換為新格式（每行只判斷一次格式）
+    
+    新格式（7欄）：入庫日期、餅乾代號、品名、驗收數量、單位、規格、最後更新日期
+    舊格式（9欄）：入庫日期、單別、單號、餅乾代號、品名、規格、單位、驗收數量、最後更新日期
+    
+    Args:
+        row: 工作表中的現有資料行
+        
+    Returns:
+        ((入庫日期, 餅乾代號), 新格式資料行)，缺少入庫日期或餅乾代號時返回 None
+    """
+    if len(row) < 2 or not row[0]:
+        return None
+    
+    receipt_date = str(row[0]).strip()
+    # 根據欄位數量判斷格式
+    if len(row) >= 9:
+        # 舊格式：餅乾代號在第4欄（索引3）
+        cookie_code = str(row[3]).strip() if row[3] else ''
+    else:
+        # 新格式：餅乾代號在第2欄（索引1）
+        cookie_code = str(row[1]).strip() if row[1] else ''
+    
+    if not receipt_date or not cookie_code:
+        return None
+    
+    key = (receipt_date, cookie_code)
+    if len(row) >= 9:
+        # 舊格式（9欄）轉換為新格式
+        return key, [
+            row[0],  # 入庫日期
+            row[3],  # 餅乾代號
+            row[4],  # 品名
+            row[7],  # 驗收數量
+            row[6],  # 單位
+            row[5],  # 規格
+            row[8]   # 最後更新日期
+        ]
+    if len(row) == 7:
+        # 可能是舊的新格式（7欄但順序不同）
+        # 檢查是否為舊順序：入庫日期、餅乾代號、品名、規格、單位、驗收數量、最後更新日期
+        # 新順序：入庫日期、餅乾代號、品名、驗收數量、單位、規格、最後更新日期
+        # 如果第4欄（索引3）是規格（通常是文字），第5欄（索引4）是單位，第6欄（索引5）是數字，則是舊順序
+        try:
+            # 嘗試判斷：如果索引5是數字，可能是舊順序
+            float(str(row[5]))
+        except (ValueError, TypeError):
+            # 已經是正確的新順序
+            return key, row
+        # 舊順序：需要重新排列
+        return key, [
+            row[0],  # 入庫日期
+            row[1],  # 餅乾代號
+            row[2],  # 品名
+            row[5],  # 驗收數量（從索引5移到索引3）
+            row[4],  # 單位（從索引4移到索引4）
+            row[3],  # 規格（從索引3移到索引5）
+            row[6]   # 最後更新日期
+        ]
+    # 已經是新格式
+    return key, row
+
+def build_row_normalizer(header: List[Any]) -> Callable[[List[Any]], Optional[Tuple[Tuple[str, str], List[Any]]]]:
+    """依現有工作表的標題行判斷資料格式（只判斷一次），返回對應的資料行轉換函數
+    
+    標題行符合 RECEIPT_LAYOUTS 中的已知格式時，每一行直接依欄位索引轉換，不再逐行判斷格式；
+    無法辨識的標題行則沿用 normalize_existing_row 逐行判斷
+    
+    Args:
+        header: 現有工作表的標題行
+        
+    Returns:
+        資料行轉換函數，傳回值與 normalize_existing_row 相同
+    """
+    # get_all_values 會將各行補齊成相同長度，先去除標題行尾端的空白欄
+    header = list(header)
+    while header and header[-1] == '':
+        header.pop()
+    layout = RECEIPT_LAYOUTS.get(tuple(header))
+    if layout is None:
+        return normalize_existing_row
+    
+    get_cols = itemgetter(*layout)
+    code_idx = layout[1]
+    min_row_len = max(layout) + 1
+    
+    def normalize(row: List[Any]) -> Optional[Tuple[Tuple[str, str], List[Any]]]:
+        if len(row) < min_row_len:
+            return normalize_existing_row(row)
+        if not row[0] or not row[code_idx]:
+            return None
+        receipt_date = str(row[0]).strip()
+        cookie_code = str(row[code_idx]).strip()
+        if not receipt_date or not cookie_code:
+            return None
+        return (receipt_date, cookie_code), list(get_cols(row))
+    
+    return normalize
+
 def sync_receipt_data(days_back: int = 5) -> bool:
     """同步完工入庫資料到 Google Sheets 的「完工入庫」工作表
     
@@ -67,7 +172,7 @@ def sync_receipt_data(days_back: int = 5) -> bool:
         logger.info("已連接到 Google Sheets")
         
         # 連接 ERP 資料庫並查詢入庫資料
-        with ERPDBHelper() as erp_db:
+        with ERPDBHelper.get_shared() as erp_db:
             logger.info("已連接到 ERP 資料庫")
             logger.info(f"查詢 ERP 完工入庫資料（最近 {days_back} 天，TF011='P104'，TF001 IN ('5801', '5802')）...")
             receipt_data = erp_db.get_receipt_data(days_back=days_back)
@@ -96,124 +201,56 @@ def sync_receipt_data(days_back: int = 5) -> bool:
             else:
                 headers = existing_data[0]
             
-            # 建立「入庫日期|餅乾代號」到資料行索引的對應（用於去重）
+            # 現有資料行只走訪一次：取得去重鍵並轉換為新格式，後續判斷與合併都使用這份結果
             data_rows = existing_data[1:] if len(existing_data) > 1 else []
-            key_to_index = {}
-            for idx, row in enumerate(data_rows):
-                # 新格式（7欄）：入庫日期、餅乾代號、品名、驗收數量、單位、規格、最後更新日期
-                # 舊格式（9欄）：入庫日期、單別、單號、餅乾代號、品名、規格、單位、驗收數量、最後更新日期
-                if len(row) >= 2 and row[0]:
-                    receipt_date = str(row[0]).strip()
-                    # 根據欄位數量判斷格式
-                    if len(row) >= 9:
-                        # 舊格式：餅乾代號在第4欄（索引3）
-                        cookie_code = str(row[3]).strip() if len(row) > 3 and row[3] else ''
-                    else:
-                        # 新格式：餅乾代號在第2欄（索引1）
-                        cookie_code = str(row[1]).strip() if len(row) > 1 and row[1] else ''
-                    
-                    if receipt_date and cookie_code:
-                        key = f"{receipt_date}|{cookie_code}"
-                        key_to_index[key] = idx
+            normalize_row = build_row_normalizer(existing_data[0] if existing_data else [])
+            normalized_rows = [
+                normalized for normalized in map(normalize_row, data_rows)
+                if normalized is not None
+            ]
+            existing_keys = {key for key, _ in normalized_rows}
             
             # 準備所有要同步的資料（在記憶體中處理）
-            # 注意：同一天同一餅乾可能有多筆入庫，需要合併驗收數量
-            processed_data = {}  # key: "入庫日期|餅乾代號", value: row_data
+            # 同一天同一餅乾的多筆入庫已在 SQL 端 GROUP BY 合併，每個鍵只會出現一次
+            processed_data = {}  # key: (入庫日期, 餅乾代號), value: row_data
             updated_count = 0
             new_count = 0
             
+            # get_receipt_data 已將各欄位轉為去除前後空白的字串，這裡直接取用
             for item in receipt_data:
-                receipt_date = format_receipt_date(str(item.get('receipt_date', '')).strip())
-                cookie_code = str(item.get('cookie_code', '')).strip()
-                cookie_name = str(item.get('cookie_name', '')).strip()
-                spec = str(item.get('spec', '')).strip()
-                unit = str(item.get('unit', '')).strip()
+                receipt_date = format_receipt_date(item.get('receipt_date', ''))
+                cookie_code = item.get('cookie_code', '')
+                cookie_name = item.get('cookie_name', '')
+                spec = item.get('spec', '')
+                unit = item.get('unit', '')
                 receipt_qty = convert_qty_to_float(item.get('receipt_qty', 0))
                 
                 if not receipt_date or not cookie_code:
                     continue
                 
-                key = f"{receipt_date}|{cookie_code}"
-                
-                # 如果已存在相同日期和餅乾代號的記錄，合併驗收數量
-                if key in processed_data:
-                    # 累加驗收數量
-                    existing_qty = processed_data[key][3]  # 驗收數量在第4欄（索引3）
-                    processed_data[key][3] = existing_qty + receipt_qty
+                key = (receipt_date, cookie_code)
+                processed_data[key] = [
+                    receipt_date,
+                    cookie_code,
+                    cookie_name,
+                    receipt_qty,
+                    unit,
+                    spec,
+                    update_date
+                ]
+                if key in existing_keys:
                     updated_count += 1
                 else:
-                    row_data = [
-                        receipt_date,
-                        cookie_code,
-                        cookie_name,
-                        receipt_qty,
-                        unit,
-                        spec,
-                        update_date
-                    ]
-                    processed_data[key] = row_data
-                    if key in key_to_index:
-                        updated_count += 1
-                    else:
-                        new_count += 1
+                    new_count += 1
             
             # 合併現有資料和處理後的資料
-            # 建立最終資料字典：key 為 "入庫日期|餅乾代號"，value 為 row_data
+            # 建立最終資料字典：key 為 (入庫日期, 餅乾代號)，value 為 row_data
             final_data_dict = {}
             
-            # 先將現有資料加入字典（保留未被更新的現有資料）
-            for idx, row in enumerate(data_rows):
-                if len(row) >= 2 and row[0]:
-                    receipt_date = str(row[0]).strip()
-                    # 根據欄位數量判斷格式
-                    if len(row) >= 9:
-                        # 舊格式：餅乾代號在第4欄（索引3）
-                        cookie_code = str(row[3]).strip() if len(row) > 3 and row[3] else ''
-                    else:
-                        # 新格式：餅乾代號在第2欄（索引1）
-                        cookie_code = str(row[1]).strip() if len(row) > 1 and row[1] else ''
-                    
-                    if receipt_date and cookie_code:
-                        key = f"{receipt_date}|{cookie_code}"
-                        # 如果這個 key 不在處理後的資料中，保留原資料（但需要轉換為新格式）
-                        if key not in processed_data:
-                            # 如果是舊格式（9欄），轉換為新格式
-                            if len(row) >= 9:  # 舊格式有9欄
-                                # 舊格式：入庫日期、單別、單號、餅乾代號、品名、規格、單位、驗收數量、最後更新日期
-                                # 新格式：入庫日期、餅乾代號、品名、驗收數量、單位、規格、最後更新日期
-                                final_data_dict[key] = [
-                                    row[0],  # 入庫日期
-                                    row[3],  # 餅乾代號
-                                    row[4] if len(row) > 4 else '',  # 品名
-                                    row[7] if len(row) > 7 else 0,   # 驗收數量
-                                    row[6] if len(row) > 6 else '',  # 單位
-                                    row[5] if len(row) > 5 else '',  # 規格
-                                    row[8] if len(row) > 8 else ''    # 最後更新日期
-                                ]
-                            elif len(row) == 7:
-                                # 可能是舊的新格式（7欄但順序不同）
-                                # 檢查是否為舊順序：入庫日期、餅乾代號、品名、規格、單位、驗收數量、最後更新日期
-                                # 新順序：入庫日期、餅乾代號、品名、驗收數量、單位、規格、最後更新日期
-                                # 如果第4欄（索引3）是規格（通常是文字），第5欄（索引4）是單位，第6欄（索引5）是數字，則是舊順序
-                                try:
-                                    # 嘗試判斷：如果索引5是數字，可能是舊順序
-                                    float(str(row[5]))
-                                    # 舊順序：需要重新排列
-                                    final_data_dict[key] = [
-                                        row[0],  # 入庫日期
-                                        row[1],  # 餅乾代號
-                                        row[2],  # 品名
-                                        row[5],  # 驗收數量（從索引5移到索引3）
-                                        row[4],  # 單位（從索引4移到索引4）
-                                        row[3],  # 規格（從索引3移到索引5）
-                                        row[6] if len(row) > 6 else ''  # 最後更新日期
-                                    ]
-                                except (ValueError, TypeError, IndexError):
-                                    # 已經是正確的新順序
-                                    final_data_dict[key] = row
-                            else:
-                                # 已經是新格式
-                                final_data_dict[key] = row
+            # 先將現有資料加入字典（保留未被更新的現有資料，已轉換為新格式）
+            for key, row in normalized_rows:
+                if key not in processed_data:
+                    final_data_dict[key] = row
             
             # 將處理後的資料加入字典（會覆蓋現有資料）
             for key, row_data in processed_data.items():
@@ -223,54 +260,47 @@ def sync_receipt_data(days_back: int = 5) -> bool:
             # 排序優先順序：入庫日期（降序）→ 餅乾代號（升序）
             logger.info("對資料進行排序（第一優先：入庫日期降序，第二優先：餅乾代號升序）...")
             
-            def sort_key(row):
-                """自定義排序鍵：入庫日期降序，餅乾代號升序"""
-                # 入庫日期（轉換為可比較的格式，用於降序）
-                date_str = str(row[0]).strip() if len(row) > 0 and row[0] else ''
-                # 將日期轉換為 YYYYMMDD 格式用於排序（取負值實現降序）
-                try:
-                    if date_str and len(date_str) == 10:  # YYYY/MM/DD
-                        date_parts = date_str.split('/')
-                        if len(date_parts) == 3:
-                            date_int = int(date_parts[0] + date_parts[1].zfill(2) + date_parts[2].zfill(2))
-                            # 使用負值實現降序
-                            date_key = -date_int
-                        else:
-                            date_key = 0
-                    else:
-                        date_key = 0
-                except (ValueError, IndexError):
-                    date_key = 0
-                
-                return (
-                    date_key,  # 入庫日期（降序）
-                    str(row[1]).strip() if len(row) > 1 and row[1] else ''  # 餅乾代號（升序）
-                )
+            def date_sort_key(row):
+                """入庫日期排序鍵：YYYY/MM/DD 字串可直接依字典序比較，不需逐筆解析；其他格式視為最舊"""
+                date_str = str(row[0]).strip() if row[0] else ''
+                return date_str if len(date_str) == 10 and date_str[4] == '/' and date_str[7] == '/' else ''
             
-            sorted_rows = sorted(final_data_dict.values(), key=sort_key)
+            # 兩次穩定排序：先依餅乾代號升序，再依入庫日期降序（同日期保留餅乾代號順序）
+            sorted_rows = sorted(final_data_dict.values(), key=lambda row: str(row[1]).strip() if row[1] else '')
+            sorted_rows.sort(key=date_sort_key, reverse=True)
             
             logger.info(f"排序完成：共 {len(sorted_rows)} 筆資料")
             
             # 組合標題行和排序後的資料行
             final_data = [headers] + sorted_rows
             
-            # 一次性批次寫入所有資料（只使用一次 API 請求）
+            # 一次性批次寫入所有資料（直接覆寫，不先清空整個工作表）
             logger.info("批次寫入所有資料到 Google Sheets...")
             if len(final_data) > 0:
-                worksheet.clear()
                 num_cols = len(headers)
-                end_col = chr(ord('A') + num_cols - 1)
-                range_name = f'A1:{end_col}{len(final_data)}'
-                worksheet.update(range_name=range_name, values=final_data)
+                num_rows = len(final_data)
+                # 較短的資料行補上空字串，覆寫時才會清掉該列原本較長的舊內容
+                final_data = [row + [''] * (num_cols - len(row)) if len(row) < num_cols else row for row in final_data]
+                range_name = f'A1:{rowcol_to_a1(num_rows, num_cols)}'
+                worksheet.update(range_name=range_name, values=final_data, value_input_option='RAW')
+                
+                # 只清除覆寫範圍以外的舊資料：多出的列，以及舊格式（9欄）多出的欄
+                existing_rows = len(existing_data)
+                existing_cols = max(map(len, existing_data), default=0)
+                stale_ranges = []
+                if existing_rows > num_rows:
+                    stale_ranges.append(f'A{num_rows + 1}:{rowcol_to_a1(existing_rows, max(existing_cols, num_cols))}')
+                if existing_cols > num_cols:
+                    stale_ranges.append(f'{rowcol_to_a1(1, num_cols + 1)}:{rowcol_to_a1(num_rows, existing_cols)}')
+                if stale_ranges:
+                    worksheet.batch_clear(stale_ranges)
             
             logger.info(f"同步完成: 更新 {updated_count} 筆，新增 {new_count} 筆，已排序")
             logger.info("=" * 60)
             return True
             
     except Exception as e:
-        logger.error(f"同步完工入庫資料失敗: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"同步完工入庫資料失敗: {str(e)}")
         return False
 
 if __name__ == '__main__':
@@ -6,6 +6,7 @@
 import sys
 from datetime import datetime
 from typing import List, Dict, Set, Any
+from gspread.utils import rowcol_to_a1
 from .google_sheets_helper import GoogleSheetsHelper
 from .erp_db_helper import ERPDBHelper
 import logging
@@ -67,7 +68,7 @@ def sync_wip_inventory() -> bool:
             logger.warning("無法進行同步：Index 工作表中沒有餅乾代號")
             return False
         # 連接 ERP 資料庫並查詢在製品庫存
-        with ERPDBHelper() as erp_db:
+        with ERPDBHelper.get_shared() as erp_db:
             logger.info("已連接到 ERP 資料庫")
             logger.info("查詢 ERP 在製品庫存資料...")
             wip_data = erp_db.get_wip_inventory()
@@ -193,8 +194,7 @@ def sync_wip_inventory() -> bool:
             if len(final_data) > 0:
                 worksheet.clear()
                 num_cols = len(headers)
-                end_col = chr(ord('A') + num_cols - 1)
-                range_name = f'A1:{end_col}{len(final_data)}'
+                range_name = f'A1:{rowcol_to_a1(len(final_data), num_cols)}'
                 worksheet.update(range_name=range_name, values=final_data)            
             logger.info(f"同步完成: 更新 {updated_count} 筆，新增 {new_count} 筆，已排序")
             logger.info("=" * 60)
@@ -0,0 +1,40 @@
+"""sync_index_from_erp.build_updated_row 的測試：以 UNFORMATTED_VALUE 讀取時 0、False 為有效值"""
+import unittest
+
+from cookies_inventory.sync_index_from_erp import build_updated_row
+
+# 新舊標題相同：每一欄對應到舊資料行的同一索引；（代號, 名稱, 生重, 熟重）位於索引 1～4
+COLUMN_PERM = [0, 1, 2, 3, 4, 5]
+FIELD_IDX = (1, 2, 3, 4)
+
+
+class BuildUpdatedRowTest(unittest.TestCase):
+    
+    def test_keeps_zero_and_false_cells_without_erp_info(self):
+        row, updated = build_updated_row(['A', 'X100', '餅', 0, 0, False], COLUMN_PERM, FIELD_IDX, {})
+        self.assertEqual(row, ['A', 'X100', '餅', 0, 0, False])
+        self.assertFalse(updated)
+    
+    def test_row_of_zeros_is_not_blank(self):
+        row, updated = build_updated_row([0, '', 0], [0, 1, 2], (0, 1, 2, 2), {})
+        self.assertEqual(row, [0, '', 0])
+        self.assertFalse(updated)
+    
+    def test_blank_row_returns_blank_row(self):
+        row, updated = build_updated_row(['', '', ''], COLUMN_PERM, FIELD_IDX, {'': {'cookie_name': 'x'}})
+        self.assertEqual(row, [''] * len(COLUMN_PERM))
+        self.assertFalse(updated)
+    
+    def test_missing_and_none_cells_become_empty_string(self):
+        row, _ = build_updated_row(['A', ' X100 ', None], COLUMN_PERM, FIELD_IDX, {})
+        self.assertEqual(row, ['A', 'X100', '', '', '', ''])
+    
+    def test_erp_info_overwrites_name_and_weights(self):
+        item_info = {'X100': {'cookie_name': '奶油餅', 'raw_weight': 12.5, 'cooked_weight': 0.0}}
+        row, updated = build_updated_row(['A', 'X100', '舊名', 0, 3, '備註'], COLUMN_PERM, FIELD_IDX, item_info)
+        self.assertEqual(row, ['A', 'X100', '奶油餅', 12.5, '', '備註'])
+        self.assertTrue(updated)
+
+
+if __name__ == '__main__':
+    unittest.main()